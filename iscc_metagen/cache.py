@@ -0,0 +1,59 @@
+"""Persistent content-addressed file cache for expensive results."""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from iscc_metagen.settings import mg_opts
+
+
+def cache_key(data):
+    # type: (dict) -> str
+    """
+    Compute a stable SHA-256 cache key for JSON serializable data.
+
+    :param data: Data that uniquely identifies the cached result
+    :return: Hex encoded SHA-256 digest
+    """
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_path(key):
+    # type: (str) -> Path
+    """Return the file path for a cache key (fanned out by key prefix)."""
+    return mg_opts.cache_dir / key[:2] / key
+
+
+def cache_get(key):
+    # type: (str) -> bytes|None
+    """
+    Load cached data for a key.
+
+    :param key: Cache key
+    :return: Cached data or None if missing or older than `mg_opts.cache_ttl` seconds
+    """
+    path = cache_path(key)
+    try:
+        if mg_opts.cache_ttl and time.time() - path.stat().st_mtime > mg_opts.cache_ttl:
+            return None
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def cache_put(key, data):
+    # type: (str, bytes) -> None
+    """
+    Atomically store data for a key.
+
+    :param key: Cache key
+    :param data: Data to store
+    """
+    path = cache_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as tmp_file:
+        tmp_file.write(data)
+    os.replace(tmp_file.name, path)
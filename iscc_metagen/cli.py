@@ -1,52 +1,93 @@
+import asyncio
 import cyclopts
+import sys
+from collections.abc import Iterable
+from importlib.util import find_spec
 from pathlib import Path
-from litellm.utils import get_valid_models
-from rich import print as rprint
-from rich.json import JSON
-from iscc_metagen.main import generate
-
+from rich import print as rprint, print_json
+from iscc_metagen.settings import mg_opts
 
 app = cyclopts.App()
 
 
 @app.default
-def main(file_path):
-    # type: (Path) -> None
+def main(*file_paths):
+    # type: (*Path) -> None
     """
-    Generate metadata for a given PDF file and output as rich-formatted JSON.
+    Generate metadata for PDF files and output as rich-formatted JSON.
 
-    :param file_path: Path to the PDF file
+    :param file_paths: Paths to PDF files or directories containing PDF files
     """
-    try:
-        metadata = generate(file_path)
-        json_output = metadata.model_dump_json(indent=2)
-        rprint(JSON(json_output))
-    except Exception as e:
-        rprint(f"[bold red]Error:[/bold red] {str(e)}")
+    pdfs = collect_pdfs(file_paths)
+    if not pdfs:
+        rprint("[bold red]Error:[/bold red] No PDF files found. Usage: metagen PATH [PATH ...]")
+        sys.exit(1)
+    asyncio.run(run_batch(pdfs))
+
+
+def collect_pdfs(paths):
+    # type: (Iterable[str|Path]) -> list[Path]
+    """
+    Expand directories into the PDF files they contain.
+
+    :param paths: Paths to PDF files or directories
+    :return: Flat list of PDF file paths
+    """
+    pdfs = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            pdfs.extend(sorted(path.glob("*.pdf")))
+        else:
+            pdfs.append(path)
+    return pdfs
+
+
+async def run_batch(paths):
+    # type: (list[Path]) -> None
+    """
+    Generate metadata for all paths concurrently and print results as they complete.
+
+    :param paths: Paths to the PDF files
+    """
+    from iscc_metagen.main import agenerate_batch
+
+    async for path, result in agenerate_batch(paths):
+        if isinstance(result, Exception):
+            rprint(f"[bold red]Error:[/bold red] {path.name} - {str(result)}")
+            continue
+        if len(paths) > 1:
+            rprint(f"[bold]{path.name}[/bold]")
+        print_json(data=result.model_dump(mode="json"))
 
 
-@app.command()
 def gui():
     # type: () -> None
     """
     Start the Streamlit GUI for the metadata generator.
     """
     import streamlit.web.cli as stcli
-    import sys
-    from pathlib import Path
 
     gui_file = Path(__file__).parent / "gui.py"
     sys.argv = ["streamlit", "run", str(gui_file)]
     sys.exit(stcli.main())
 
 
+# The GUI is only available with the optional `gui` extra installed
+if find_spec("streamlit") is not None:
+    app.command(gui)
+
+
 @app.command()
 def models():
     # type: () -> None
     """
-    List all LiteLLM supported models.
+    List the configured models (or all LiteLLM supported models if none are configured).
     """
-    model_list = get_valid_models()
+    model_list = mg_opts.litellm_models
+    if not model_list:
+        from litellm.utils import get_valid_models
+
+        model_list = get_valid_models()
     rprint("[bold]Supported LiteLLM Models:[/bold]")
     for model in model_list:
         rprint(f"- {model}")
@@ -1,10 +1,136 @@
-from litellm import OllamaConfig, completion
-import instructor
+import json
+from functools import cache
+from loguru import logger as log
+from pydantic_core import to_json
+from iscc_metagen.cache import cache_get, cache_key, cache_put
 from iscc_metagen.settings import mg_opts
 
-OllamaConfig(
-    num_ctx=mg_opts.ollama_num_ctx,
-    num_gpu=mg_opts.ollama_num_gpu,
+# Request arguments that determine the response of a completion call (including the merged
+# Ollama runner options, as the context size decides how much of the prompt the model sees)
+CACHE_KEY_ARGS = (
+    "model",
+    "messages",
+    "tools",
+    "tool_choice",
+    "response_format",
+    "temperature",
+    "top_p",
+    "seed",
+    "stop",
+    "max_tokens",
+    "max_completion_tokens",
+    "num_ctx",
+    "num_gpu",
+    "num_batch",
+    "num_predict",
 )
+OLLAMA_PREFIXES = ("ollama/", "ollama_chat/")
 
-client = instructor.from_litellm(completion, mode=mg_opts.instructor_mode)
+
+def cached_completion(**kwargs):
+    # type: (...) -> ModelResponse
+    """
+    Call litellm `completion` with a persistent on-disk response cache.
+
+    Only deterministic (temperature unset or 0) non-streaming calls are cached.
+    """
+    from litellm import completion
+
+    kwargs = add_ollama_options(kwargs)
+    key = completion_cache_key(kwargs)
+    response = load_cached_response(key) if key else None
+    if response is None:
+        response = completion(**kwargs)
+        if key:
+            store_cached_response(key, response)
+    return response
+
+
+async def acached_completion(**kwargs):
+    # type: (...) -> ModelResponse
+    """
+    Call litellm `acompletion` with a persistent on-disk response cache.
+
+    Only deterministic (temperature unset or 0) non-streaming calls are cached.
+    """
+    from litellm import acompletion
+
+    kwargs = add_ollama_options(kwargs)
+    key = completion_cache_key(kwargs)
+    response = load_cached_response(key) if key else None
+    if response is None:
+        response = await acompletion(**kwargs)
+        if key:
+            store_cached_response(key, response)
+    return response
+
+
+def add_ollama_options(kwargs):
+    # type: (dict) -> dict
+    """
+    Add tuned runner options to completion arguments for Ollama models.
+
+    Options passed explicitly by the caller take precedence.
+
+    :param kwargs: Keyword arguments of the completion call
+    :return: Updated keyword arguments
+    """
+    if str(kwargs.get("model", "")).startswith(OLLAMA_PREFIXES):
+        kwargs.setdefault("num_ctx", mg_opts.ollama_num_ctx)
+        kwargs.setdefault("num_gpu", mg_opts.ollama_num_gpu)
+        kwargs.setdefault("num_batch", mg_opts.ollama_num_batch)
+    return kwargs
+
+
+def completion_cache_key(kwargs):
+    # type: (dict) -> str|None
+    """
+    Compute the cache key for completion request arguments.
+
+    :param kwargs: Keyword arguments of the completion call
+    :return: Cache key or None if the request should not be cached
+    """
+    if not mg_opts.cache_enabled or kwargs.get("stream") or (kwargs.get("temperature") or 0) > 0:
+        return None
+    return cache_key({arg: kwargs.get(arg) for arg in CACHE_KEY_ARGS})
+
+
+def load_cached_response(key):
+    # type: (str) -> ModelResponse|None
+    """Load a cached model response. Cache hits are reported with zero response cost."""
+    data = cache_get(key)
+    if data is None:
+        return None
+    from litellm.types.utils import ModelResponse
+
+    log.debug(f"Using cached LLM response {key[:12]}")
+    response = ModelResponse(**json.loads(data))
+    response._hidden_params = {"response_cost": 0.0, "cache_hit": True}
+    return response
+
+
+def store_cached_response(key, response):
+    # type: (str, ModelResponse) -> None
+    """Store a model response in the cache."""
+    try:
+        cache_put(key, to_json(response))
+    except OSError as e:
+        log.warning(f"Failed to cache LLM response: {e}")
+
+
+@cache
+def get_client():
+    # type: () -> instructor.Instructor
+    """Create the LLM client on first use (defers the costly litellm import)."""
+    import instructor
+
+    return instructor.from_litellm(cached_completion, mode=mg_opts.instructor_mode)
+
+
+@cache
+def get_aclient():
+    # type: () -> instructor.AsyncInstructor
+    """Create the async LLM client on first use (defers the costly litellm import)."""
+    import instructor
+
+    return instructor.from_litellm(acached_completion, mode=mg_opts.instructor_mode)
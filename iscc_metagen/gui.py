@@ -1,23 +1,97 @@
+import asyncio
+import io
+import time
 import streamlit as st
-from pathlib import Path
-import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from loguru import logger
-from iscc_metagen.main import generate
+from PIL import Image
+from pydantic import BaseModel, Field
+from pydantic_core import to_json
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from iscc_metagen.cache import cache_get, cache_key, cache_put
+from iscc_metagen.main import agenerate_stream
 from iscc_metagen.schema import BookMetadata
-from iscc_metagen.pdf import pdf_extract_cover
+from iscc_metagen.pdf import pdf_digest, pdf_extract_cover, pdf_extract_pages
 from iscc_metagen.settings import mg_opts
-from iscc_metagen.thema import predict_categories, thema_db
+from iscc_metagen.thema import apredict_categories, get_thema
+
+# Number of recent log messages shown in the status container
+LOG_LINES = 50
+# Minimum number of seconds between log updates sent to the browser
+LOG_INTERVAL = 0.2
+# Maximum size of the cover image sent to the browser (fits the cover column)
+COVER_DISPLAY_SIZE = (400, 600)
+
+PAGE_CONTAINER_CSS = """
+<style>
+.block-container {
+    max-width: 1280px;
+    padding-top: 2rem;
+    padding-bottom: 2rem;
+}
+</style>
+"""
+
+KEYWORD_PILL_CSS = """
+<style>
+.keyword-pill {
+    display: inline-block;
+    color: white;
+    background-color: #ff4b4b;
+    border-radius: 16px;
+    padding: 4px 10px;
+    margin: 4px;
+    font-size: 14px;
+}
+</style>
+"""
+
+PAGE_CSS = PAGE_CONTAINER_CSS + KEYWORD_PILL_CSS
+
+COST_CARD_HTML = (
+    '<div style="background-color: {color};padding:10px;border-radius:5px;text-align:center;">'
+    '<h3 style="margin:0;color:white;">{label}: {cost}</h3>'
+    "</div>"
+)
+
+
+class Upload(BaseModel):
+    """An uploaded PDF file held in memory for processing."""
+
+    name: str = Field(..., description="Original file name of the upload")
+    data: bytes = Field(..., description="Content of the uploaded file", repr=False)
+    digest: str = Field(..., description="SHA-256 hex digest of the file content")
+
+
+class StreamlitSink:
+    """
+    Loguru sink that renders the most recent log messages into a Streamlit status container.
+
+    Updates are throttled to one per `LOG_INTERVAL` seconds so chatty pipelines do not send a
+    browser update per log line. Call `flush` after removing the sink to show the final state.
+    """
 
-# Global variable to store the Streamlit placeholder
-streamlit_log_placeholder = None
+    def __init__(self, status):
+        # type: (StatusContainer) -> None
+        self.status = status
+        self.placeholder = status.empty()
+        self.messages = deque(maxlen=LOG_LINES)
+        self.last_flush = 0.0
 
+    def __call__(self, message):
+        # type: (Message) -> None
+        self.messages.append(message.record["message"])
+        if time.monotonic() - self.last_flush >= LOG_INTERVAL:
+            self.flush()
 
-def streamlit_sink(message):
-    global streamlit_log_placeholder
-    if streamlit_log_placeholder is not None:
-        msg = f"{message.record['message']}"
-        streamlit_log_placeholder.write(msg)
-        streamlit_log_placeholder.update(label=msg)
+    def flush(self):
+        # type: () -> None
+        """Render buffered log messages and show the latest one as status label."""
+        self.last_flush = time.monotonic()
+        if self.messages:
+            self.placeholder.text("\n".join(self.messages))
+            self.status.update(label=self.messages[-1])
 
 
 def create_sidebar():
@@ -44,117 +118,69 @@ def format_response_cost(cost):
 
 def set_page_container_style():
     # type: () -> None
-    """Set max-width of the content area."""
-    st.markdown(
-        """
-        <style>
-        .block-container {
-            max-width: 1280px;
-            padding-top: 2rem;
-            padding-bottom: 2rem;
-        }
-        </style>
-        """,
-        unsafe_allow_html=True,
-    )
+    """
+    Set max-width of the content area and inject the keyword pill styles.
+
+    All page styles are emitted as a single element. It must be emitted on every script run as
+    Streamlit removes elements that are not re-emitted on a rerun.
+    """
+    st.markdown(PAGE_CSS, unsafe_allow_html=True)
+
+
+def display_cost_card(label, cost, color):
+    # type: (str, float, str) -> None
+    """Display a response cost as a colored card."""
+    html = COST_CARD_HTML.format(color=color, label=label, cost=format_response_cost(cost))
+    st.markdown(html, unsafe_allow_html=True)
 
 
 def display_metadata(metadata):
     # type: (BookMetadata) -> None
-    """Display BookMetadata in a visually appealing manner."""
-
-    st.markdown(
-        f"""
-        <div style="background-color: #ff4b4b;padding:10px;border-radius:5px;text-align:center;">
-            <h3 style="margin:0;color:white;">Response Cost: {format_response_cost(metadata.response_cost)}</h3>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
+    """Display (partially populated) BookMetadata in a visually appealing manner."""
+
+    display_cost_card("Response Cost", metadata.response_cost or 0.0, "#ff4b4b")
 
-    st.header(metadata.title, divider=True)
+    st.header(metadata.title or "", divider=True)
     if metadata.subtitle:
         st.subheader(metadata.subtitle)
 
-    st.markdown(f"**Description:** {metadata.description}")
-
-    keywords_html = """
-    <style>
-    .keyword-pill {
-        display: inline-block;
-        color: white;
-        background-color: #ff4b4b;
-        border-radius: 16px;
-        padding: 4px 10px;
-        margin: 4px;
-        font-size: 14px;
-    }
-    </style>
-    <div>
-    """
-    for keyword in metadata.keywords:
-        keywords_html += f'<span class="keyword-pill">{keyword}</span>'
-    keywords_html += "</div>"
+    st.markdown(f"**Description:** {metadata.description or ''}")
 
-    st.markdown(keywords_html, unsafe_allow_html=True)
+    keywords_html = "".join(
+        f'<span class="keyword-pill">{keyword}</span>' for keyword in metadata.keywords or []
+    )
+    st.markdown(f"<div>{keywords_html}</div>", unsafe_allow_html=True)
 
     # Create a table for the remaining metadata
     table_data = [
-        ["Publisher", metadata.publisher or "N/A"],
-        ["Language", metadata.language],
-        ["Year Published", str(metadata.year_published) if metadata.year_published else "N/A"],
-        [
-            "Publisher Website",
-            (
-                f"<a href='{metadata.publisher_website}'>{metadata.publisher_website}</a>"
-                if metadata.publisher_website
-                else "N/A"
-            ),
-        ],
+        {"Field": "Publisher", "Value": metadata.publisher or "N/A"},
+        {"Field": "Language", "Value": metadata.language or "N/A"},
+        {"Field": "Year Published", "Value": str(metadata.year_published or "N/A")},
     ]
 
     # Add contributors to the table
-    if metadata.contributors:
-        contributors = ", ".join([f"{c.name} ({c.role})" for c in metadata.contributors])
-        table_data.append(["Contributors", contributors])
+    contributors = [c for c in metadata.contributors or [] if c.name and c.role]
+    if contributors:
+        contributors = ", ".join([f"{c.name} ({c.role})" for c in contributors])
+        table_data.append({"Field": "Contributors", "Value": contributors})
 
     # Add ISBNs to the table
-    if metadata.isbns:
-        isbns = ", ".join(
-            [f"{isbn.isbn} (Edition: {isbn.edition or 'N/A'})" for isbn in metadata.isbns]
-        )
-        table_data.append(["ISBNs", isbns])
-
-    # Create custom HTML table with improved styling
-    table_html = """
-    <style>
-    .custom-table {
-        width: 100%;
-        border-collapse: collapse;
-        color: var(--text-color);
-    }
-    .custom-table td {
-        border: 1px solid var(--secondary-background-color);
-        padding: 8px;
-    }
-    .custom-table tr:nth-child(even) {
-        background-color: var(--secondary-background-color);
-    }
-    .custom-table tr:nth-child(odd) {
-        background-color: var(--background-color);
-    }
-    .custom-table td:first-child {
-        font-weight: bold;
-        width: 30%;
-    }
-    </style>
-    <table class="custom-table">
-    """
-    for row in table_data:
-        table_html += f"<tr><td>{row[0]}</td><td>{row[1]}</td></tr>"
-    table_html += "</table>"
-    st.markdown("<br>", unsafe_allow_html=True)
-    st.markdown(table_html, unsafe_allow_html=True)
+    isbns = [isbn for isbn in metadata.isbns or [] if isbn.isbn]
+    if isbns:
+        isbns = ", ".join([f"{isbn.isbn} (Edition: {isbn.edition or 'N/A'})" for isbn in isbns])
+        table_data.append({"Field": "ISBNs", "Value": isbns})
+
+    st.dataframe(
+        table_data,
+        hide_index=True,
+        use_container_width=True,
+        column_config={"Field": st.column_config.TextColumn(width="small")},
+    )
+
+    # Rendered outside the table so the website stays a clickable link
+    website = metadata.publisher_website
+    link = f"[{website}]({website})" if website else "N/A"
+    st.markdown(f"**Publisher Website:** {link}")
 
     # Add collapsible JSON area
     with st.expander("View JSON"):
@@ -165,29 +191,32 @@ def display_metadata(metadata):
 def display_thema_categories(thema_categories):
     # type: (ThemaCategories) -> None
     """Display Thema categories in a table format."""
-    st.markdown(
-        f"""
-        <div style="background-color: #4b4bff;padding:10px;border-radius:5px;text-align:center;">
-            <h3 style="margin:0;color:white;">Thema Categories Cost: {format_response_cost(thema_categories.response_cost)}</h3>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
+    display_cost_card("Thema Categories Cost", thema_categories.response_cost, "#4b4bff")
 
     st.subheader("Thema Categories", divider=True)
 
     # Create a DataFrame for the table
+    thema = get_thema()
     data = [
         {
             "Code": category.category_code,
-            "Full Heading": thema_db.get(category.category_code).full_heading,
+            "Full Heading": thema.full_heading(category.category_code),
             "Confidence": category.confidence,
         }
         for category in thema_categories.categories
     ]
 
     # Display the table
-    st.table(data)
+    st.dataframe(
+        data,
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "Code": st.column_config.TextColumn(width="small"),
+            "Full Heading": st.column_config.TextColumn(width="large"),
+            "Confidence": st.column_config.TextColumn(width="small"),
+        },
+    )
 
     # Add collapsible JSON area
     with st.expander("View Thema Categories JSON"):
@@ -195,82 +224,231 @@ def display_thema_categories(thema_categories):
         st.code(json_output, language="json")
 
 
-def main():
-    # type: () -> None
-    global streamlit_log_placeholder
+async def process_uploads(uploaded_files, model):
+    # type: (list[UploadedFile], str) -> bool
+    """
+    Process all uploaded files concurrently.
 
-    st.set_page_config(page_title="MetaGen", layout="wide")
-    set_page_container_style()
+    Blocking PDF work runs in worker threads that share the script run context, so log messages and
+    placeholder updates from those threads still reach the page.
 
-    selected_model = create_sidebar()
+    :param uploaded_files: Files uploaded via the Streamlit file uploader
+    :param model: AI model to use for generation
+    :return: True if all files were processed successfully
+    """
+    ctx = get_script_run_ctx()
+    executor = ThreadPoolExecutor(initializer=add_script_run_ctx, initargs=(None, ctx))
+    asyncio.get_running_loop().set_default_executor(executor)
+    semaphore = asyncio.Semaphore(mg_opts.max_concurrency)
+    results = await asyncio.gather(*(process_upload(f, model, semaphore) for f in uploaded_files))
+    return all(results)
 
-    st.title("MetaGen - Metadata Generator")
-    st.subheader("Generative Structured Digital Content Metadata Recognition and Extraction")
 
-    uploaded_file = st.file_uploader("Choose a PDF file", type="pdf")
+async def process_upload(uploaded_file, model, semaphore):
+    # type: (UploadedFile, str, asyncio.Semaphore) -> bool
+    """
+    Extract cover, metadata and Thema categories for one uploaded file and render them.
 
-    if uploaded_file is not None:
-        # Create status container
-        status = st.status("Processing...", expanded=False)
+    :param uploaded_file: File uploaded via the Streamlit file uploader
+    :param model: AI model to use for generation
+    :param semaphore: Semaphore limiting the number of files processed concurrently
+    :return: True if the file was processed successfully
+    """
+    st.subheader(uploaded_file.name, divider=True)
+
+    # Create two columns for cover image and metadata
+    col1, col2 = st.columns([1, 2])
+
+    # Create placeholders for cover image, metadata and Thema categories
+    with col1:
+        cover_image_placeholder = st.empty()
+    with col2:
+        metadata_placeholder = st.empty()
+    thema_placeholder = st.empty()
+
+    async with semaphore:
+        try:
+            data = uploaded_file.getvalue()
+            upload = Upload(
+                name=uploaded_file.name,
+                data=data,
+                digest=pdf_digest(data),
+            )
+
+            # Extract text once so metadata generation and Thema prediction share the result
+            await asyncio.to_thread(pdf_extract_pages, upload.data)
 
-        # Create log placeholder inside the status container
-        streamlit_log_placeholder = status
+            # Extract cover, generate metadata and predict Thema categories concurrently
+            results = await asyncio.gather(
+                render_cover(cover_image_placeholder, upload),
+                render_metadata(metadata_placeholder, upload, model),
+                render_thema(thema_placeholder, upload),
+                return_exceptions=True,
+            )
+            placeholders = (cover_image_placeholder, metadata_placeholder, thema_placeholder)
+            return show_errors(placeholders, results)
+        except Exception as e:
+            metadata_placeholder.error(f"An error occurred: {str(e)}")
+            logger.exception("An error occurred during processing")
+            return False
 
-        # Create two columns for cover image and metadata
-        col1, col2 = st.columns([1, 2])
 
-        # Create placeholders for cover image and metadata
-        with col1:
-            cover_image_placeholder = st.empty()
-        with col2:
-            metadata_placeholder = st.empty()
+@st.cache_data(show_spinner=False, persist="disk")
+def cached_cover(digest, _data):
+    # type: (str, bytes) -> bytes|None
+    """
+    Extract the cover image of a PDF file for display, cached by file content digest.
 
-        # Add the Streamlit sink to loguru
-        sink_id = logger.add(streamlit_sink, format="{message}")
+    The cover is downscaled to `COVER_DISPLAY_SIZE` and encoded as WebP to keep the image
+    small on the wire.
 
+    :param digest: SHA-256 hex digest of the file content (cache key)
+    :param _data: Content of the PDF file (excluded from the cache key)
+    :return: WebP encoded image or None if extraction fails
+    """
+    cover = pdf_extract_cover(_data)
+    if cover is None:
+        return None
+    img = Image.open(cover)
+    img.thumbnail(COVER_DISPLAY_SIZE)
+    img_byte_arr = io.BytesIO()
+    img.save(img_byte_arr, format="WEBP", quality=85)
+    return img_byte_arr.getvalue()
+
+
+def load_cached_metadata(key):
+    # type: (str) -> BookMetadata|None
+    """Load previously generated metadata from the persistent cache (reported with zero cost)."""
+    data = cache_get(key) if mg_opts.cache_enabled else None
+    if data is None:
+        return None
+    metadata = BookMetadata.model_validate_json(data)
+    metadata.response_cost = 0.0
+    return metadata
+
+
+def store_cached_metadata(key, metadata):
+    # type: (str, BookMetadata) -> None
+    """Store generated metadata in the persistent cache."""
+    if mg_opts.cache_enabled:
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                tmp_file_path = Path(tmp_file.name)
+            cache_put(key, to_json(metadata))
+        except OSError as e:
+            logger.warning(f"Failed to cache metadata: {e}")
 
-            cover_image = pdf_extract_cover(tmp_file_path)
 
-            if cover_image:
-                with cover_image_placeholder.container():
-                    st.image(cover_image, caption="Cover Image", use_column_width=True)
-            else:
-                with cover_image_placeholder.container():
-                    st.warning("Failed to extract cover image.")
+async def render_cover(placeholder, upload):
+    # type: (DeltaGenerator, Upload) -> None
+    """
+    Extract the cover image of an uploaded PDF file and render it into a placeholder.
+
+    :param placeholder: Streamlit placeholder for the cover image
+    :param upload: Uploaded PDF file
+    """
+    cover_image = await asyncio.to_thread(cached_cover, upload.digest, upload.data)
+    with placeholder.container():
+        if cover_image:
+            st.image(cover_image, caption="Cover Image")
+        else:
+            st.warning("Failed to extract cover image.")
 
-            metadata = generate(tmp_file_path, model=selected_model)
 
-            status.update(label="Metadata generation completed!", state="complete", expanded=False)
+async def render_metadata(placeholder, upload, model):
+    # type: (DeltaGenerator, Upload, str) -> None
+    """
+    Generate metadata for an uploaded PDF file and progressively render it into a placeholder.
+
+    Results are cached by file content digest, model and page selection, so re-uploads and reruns
+    skip generation.
 
-            # Display metadata
-            with metadata_placeholder.container():
-                display_metadata(metadata)
+    :param placeholder: Streamlit placeholder for the metadata
+    :param upload: Uploaded PDF file
+    :param model: AI model to use for generation
+    """
+    pages = [mg_opts.front_pages, mg_opts.mid_pages, mg_opts.back_pages]
+    key = cache_key(
+        {"digest": upload.digest, "model": model, "pages": pages, "kind": "book_metadata"}
+    )
+    metadata = load_cached_metadata(key)
+    if metadata is not None:
+        with placeholder.container():
+            display_metadata(metadata)
+        return
+
+    rendered = None
+    async for metadata in agenerate_stream(upload.data, model=model):
+        current = metadata.model_dump()
+        if current == rendered:
+            continue
+        with placeholder.container():
+            display_metadata(metadata)
+        rendered = current
+    store_cached_metadata(key, metadata)
+
+
+async def render_thema(placeholder, upload):
+    # type: (DeltaGenerator, Upload) -> None
+    """
+    Predict Thema categories for an uploaded PDF file and render them into a placeholder.
 
-            # Start Thema category prediction
-            status.update(label="Predicting Thema categories...", state="running", expanded=False)
+    :param placeholder: Streamlit placeholder for the Thema categories
+    :param upload: Uploaded PDF file
+    """
+    logger.info(f"Predicting Thema categories for {upload.name}")
+    thema_categories = await apredict_categories(upload.data)
+    with placeholder.container():
+        display_thema_categories(thema_categories)
 
-            thema_categories = predict_categories(tmp_file_path)
 
-            status.update(
-                label="Thema category prediction completed!", state="complete", expanded=False
-            )
+def show_errors(placeholders, results):
+    # type: (Iterable[DeltaGenerator], Iterable[object]) -> bool
+    """
+    Render exceptions returned by concurrent tasks into their placeholders.
 
-            # Display Thema categories
-            display_thema_categories(thema_categories)
+    :param placeholders: Placeholders in the same order as the task results
+    :param results: Task results as returned by `asyncio.gather(..., return_exceptions=True)`
+    :return: True if none of the tasks failed
+    """
+    ok = True
+    for placeholder, result in zip(placeholders, results):
+        if isinstance(result, Exception):
+            placeholder.error(f"An error occurred: {str(result)}")
+            logger.opt(exception=result).error("An error occurred during processing")
+            ok = False
+    return ok
 
-        except Exception as e:
-            status.update(label="An error occurred", state="error")
-            st.error(f"An error occurred: {str(e)}")
-            logger.exception("An error occurred during processing")
+
+def main():
+    # type: () -> None
+    st.set_page_config(page_title="MetaGen", layout="wide")
+    set_page_container_style()
+
+    selected_model = create_sidebar()
+
+    st.title("MetaGen - Metadata Generator")
+    st.subheader("Generative Structured Digital Content Metadata Recognition and Extraction")
+
+    uploaded_files = st.file_uploader("Choose PDF files", type="pdf", accept_multiple_files=True)
+
+    if uploaded_files:
+        # Create status container
+        status = st.status("Processing...", expanded=False)
+
+        # Add the Streamlit sink rendering log messages into the status container to loguru
+        sink = StreamlitSink(status)
+        sink_id = logger.add(sink, format="{message}")
+
+        try:
+            ok = asyncio.run(process_uploads(uploaded_files, selected_model))
         finally:
-            # Remove the Streamlit sink after processing is complete
+            # Remove the Streamlit sink after processing is complete and show remaining messages
             logger.remove(sink_id)
-            if "tmp_file_path" in locals():
-                tmp_file_path.unlink()
+            sink.flush()
+
+        if ok:
+            status.update(label="Processing completed!", state="complete", expanded=False)
+        else:
+            status.update(label="An error occurred", state="error")
 
 
 if __name__ == "__main__":
@@ -1,18 +1,21 @@
+import asyncio
+import json
+from collections.abc import AsyncIterator, Iterator
 from loguru import logger as log
 from pathlib import Path
-from litellm.types.utils import ModelResponse
-from iscc_metagen.schema import BookMetadata
-from iscc_metagen.client import client
+from iscc_metagen.schema import BookISBN, BookMetadata, StreamedBookMetadata
+from iscc_metagen.client import get_aclient, get_client
 from iscc_metagen.settings import mg_opts
 from iscc_metagen.pdf import pdf_extract_pages
+from iscc_metagen.text import text_find_isbns
 
 
 def generate(file, model=None, max_retries=None):
-    # type: (str|Path, str|None, int|None) -> BookMetadata
+    # type: (str|Path|bytes, str|None, int|None) -> BookMetadata
     """
     Generate metadata from a PDF file.
 
-    :param file: Path to the PDF file.
+    :param file: Path to the PDF file or its content as bytes.
     :param model: AI model to use for generation.
     :param max_retries: Maximum number of retries for API calls.
     :return: Generated book metadata.
@@ -35,18 +38,216 @@ def generate_metadata(text, model=None, max_retries=None):
     model = model or mg_opts.litellm_model_name
     max_retries = max_retries or mg_opts.max_retries
     log.info(f"Generating metadata from text with max {max_retries} retries")
-    metadata, model_response = client.chat.completions.create_with_completion(
+    metadata, model_response = get_client().chat.completions.create_with_completion(
         model=model,
         max_retries=max_retries,
-        messages=[
-            {
-                "role": "user",
-                "content": text,
-            },
-        ],
+        messages=metadata_messages(text),
         response_model=BookMetadata,
     )
-    model_response: ModelResponse
+    return backfill_isbns(add_response_info(metadata, model_response), text)
+
+
+def generate_stream(file, model=None):
+    # type: (str|Path|bytes, str|None) -> Iterator[BookMetadata]
+    """
+    Generate metadata from a PDF file and yield partial results while the response streams in.
+
+    :param file: Path to the PDF file or its content as bytes.
+    :param model: AI model to use for generation.
+    :return: Iterator of partially populated metadata followed by the validated book metadata.
+    """
+    model = model or mg_opts.litellm_model_name
+    text = pdf_extract_pages(file)
+    log.info("Streaming metadata from text")
+    partial = None
+    for partial in get_client().chat.completions.create_partial(
+        model=model,
+        messages=metadata_messages(text),
+        response_model=StreamedBookMetadata,
+    ):
+        yield partial
+    try:
+        metadata = complete_metadata(partial, model, text)
+    except ValueError as e:
+        log.warning(f"Streamed metadata is invalid, regenerating with retries: {e}")
+        yield generate_metadata(text, model)
+        return
+    yield backfill_isbns(metadata, text)
+
+
+async def agenerate(file, model=None, max_retries=None):
+    # type: (str|Path|bytes, str|None, int|None) -> BookMetadata
+    """
+    Generate metadata from a PDF file without blocking the event loop.
+
+    :param file: Path to the PDF file or its content as bytes.
+    :param model: AI model to use for generation.
+    :param max_retries: Maximum number of retries for API calls.
+    :return: Generated book metadata.
+    """
+    text = await asyncio.to_thread(pdf_extract_pages, file)
+    metadata = await agenerate_metadata(text, model, max_retries)
+    return metadata
+
+
+async def agenerate_metadata(text, model=None, max_retries=None):
+    # type: (str, str|None, int|None) -> BookMetadata
+    """
+    Generate metadata from text input using the async LLM client.
+
+    :param text: Extracted text from PDF.
+    :param model: AI model to use for generation.
+    :param max_retries: Maximum number of retries for API calls.
+    :return: Generated book metadata.
+    """
+    model = model or mg_opts.litellm_model_name
+    max_retries = max_retries or mg_opts.max_retries
+    log.info(f"Generating metadata from text with max {max_retries} retries")
+    metadata, model_response = await get_aclient().chat.completions.create_with_completion(
+        model=model,
+        max_retries=max_retries,
+        messages=metadata_messages(text),
+        response_model=BookMetadata,
+    )
+    return backfill_isbns(add_response_info(metadata, model_response), text)
+
+
+async def agenerate_stream(file, model=None):
+    # type: (str|Path|bytes, str|None) -> AsyncIterator[BookMetadata]
+    """
+    Generate metadata from a PDF file and yield partial results while the response streams in.
+
+    :param file: Path to the PDF file or its content as bytes.
+    :param model: AI model to use for generation.
+    :return: Async iterator of partially populated metadata followed by the validated book metadata.
+    """
+    model = model or mg_opts.litellm_model_name
+    text = await asyncio.to_thread(pdf_extract_pages, file)
+    log.info("Streaming metadata from text")
+    stream = get_aclient().chat.completions.create_partial(
+        model=model,
+        messages=metadata_messages(text),
+        response_model=StreamedBookMetadata,
+    )
+    partial = None
+    async for partial in stream:
+        yield partial
+    try:
+        metadata = complete_metadata(partial, model, text)
+    except ValueError as e:
+        log.warning(f"Streamed metadata is invalid, regenerating with retries: {e}")
+        yield await agenerate_metadata(text, model)
+        return
+    yield backfill_isbns(metadata, text)
+
+
+async def agenerate_batch(files, model=None):
+    # type: (list[str|Path], str|None) -> AsyncIterator[tuple[str|Path, BookMetadata|Exception]]
+    """
+    Generate metadata for multiple PDF files concurrently.
+
+    At most `mg_opts.max_concurrency` files are processed at the same time. Results are yielded in
+    order of completion. Failures are yielded as exceptions so one broken file does not abort the
+    whole batch.
+
+    :param files: Paths to the PDF files.
+    :param model: AI model to use for generation.
+    :return: Async iterator of (file, metadata or exception) tuples.
+    """
+    semaphore = asyncio.Semaphore(mg_opts.max_concurrency)
+    tasks = [agenerate_bounded(file, model, semaphore) for file in files]
+    for task in asyncio.as_completed(tasks):
+        yield await task
+
+
+async def agenerate_bounded(file, model, semaphore):
+    # type: (str|Path, str|None, asyncio.Semaphore) -> tuple[str|Path, BookMetadata|Exception]
+    """
+    Generate metadata for a single file while holding the batch semaphore.
+
+    :param file: Path to the PDF file.
+    :param model: AI model to use for generation.
+    :param semaphore: Semaphore limiting the number of concurrent generations.
+    :return: Tuple of file and generated metadata or the exception raised.
+    """
+    async with semaphore:
+        try:
+            return file, await agenerate(file, model)
+        except Exception as e:
+            log.error(f"Failed to generate metadata for {file}: {e}")
+            return file, e
+
+
+def metadata_messages(text):
+    # type: (str) -> list[dict]
+    """Build the chat messages for metadata generation (with ISBNs detected in the text as hint)."""
+    isbns = text_find_isbns(text)
+    if isbns:
+        text = f"{text}\n\nISBNs found in the text: {', '.join(isbns)}"
+    return [
+        {
+            "role": "user",
+            "content": text,
+        },
+    ]
+
+
+def complete_metadata(partial, model, text):
+    # type: (StreamedBookMetadata|None, str, str) -> BookMetadata
+    """
+    Validate the last streamed partial result as complete book metadata and add its cost.
+
+    :param partial: Last partial result of a metadata stream.
+    :param model: AI model used for generation.
+    :param text: Extracted text the metadata was generated from.
+    :return: Validated book metadata.
+    :raises ValueError: If the stream produced no result or the result is invalid.
+    """
+    if partial is None:
+        raise ValueError("Metadata stream ended without a result")
+    data = partial.model_dump(mode="json", exclude={"model", "response_cost"})
+    metadata = BookMetadata.model_validate(data)
+    metadata.model = model
+    response_cost = stream_cost(model, text, json.dumps(data))
+    if response_cost is not None:
+        metadata.response_cost = response_cost
+    return metadata
+
+
+def stream_cost(model, text, completion):
+    # type: (str, str, str) -> float|None
+    """
+    Estimate the cost of a streamed response from the prompt and the completed output.
+
+    Streamed responses carry no usage, so tokens are counted with the model tokenizer.
+
+    :param model: AI model used for generation.
+    :param text: Extracted text the metadata was generated from.
+    :param completion: Completed response content.
+    :return: Response cost in USD or None if the model has no known pricing.
+    """
+    from litellm import completion_cost
+
+    try:
+        return completion_cost(model=model, messages=metadata_messages(text), completion=completion)
+    except Exception as e:
+        log.debug(f"No response cost for {model}: {e}")
+        return None
+
+
+def backfill_isbns(metadata, text):
+    # type: (BookMetadata, str) -> BookMetadata
+    """Add the ISBNs found in the text to the metadata if the model returned none."""
+    if not metadata.isbns:
+        isbns = text_find_isbns(text)
+        if isbns:
+            metadata.isbns = [BookISBN(isbn=isbn) for isbn in isbns]
+    return metadata
+
+
+def add_response_info(metadata, model_response):
+    # type: (BookMetadata, ModelResponse) -> BookMetadata
+    """Attach model name and response cost from the raw model response to the metadata."""
     metadata.model = model_response["model"]
     response_cost = model_response._hidden_params["response_cost"]
     if response_cost is not None:
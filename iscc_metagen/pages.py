@@ -1,12 +1,19 @@
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List
 import fitz
 import pymupdf4llm
-from iscc_metagen.schema import PageType, Page
-from iscc_metagen.client import client
+from iscc_metagen.schema import PageType, PageTypes, Page
+from iscc_metagen.client import get_client
 from iscc_metagen.settings import mg_opts
 from loguru import logger as log
 
+# Number of pages classified together in one LLM request
+PAGE_BATCH_SIZE = 5
+# Page types whose content is collected for metadata extraction
+COLLECT_PAGE_TYPES = frozenset(("TITLE_PAGE", "IMPRINT", "TABLE_OF_CONTENTS"))
+
 
 def get_page_type(text, pageno=None):
     # type: (str, int|None) -> PageType
@@ -19,7 +26,7 @@ def get_page_type(text, pageno=None):
             f" page:\n\n<page_number>{pageno}</page_number>\n<page_text>{text}</page_text>"
         )
 
-    return client.chat.completions.create(
+    return get_client().chat.completions.create(
         model=mg_opts.litellm_model_name,
         response_model=PageType,
         messages=[
@@ -31,44 +38,49 @@ def get_page_type(text, pageno=None):
     )
 
 
+def get_page_types(contents):
+    # type: (dict[int, str]) -> list[PageType]
+    """Perform single-label page-type classification for multiple pages in one request"""
+    page_texts = "\n".join(
+        f"<page>\n<page_number>{pageno}</page_number>\n<page_text>{text}</page_text>\n</page>"
+        for pageno, text in contents.items()
+    )
+    prompt = f"Classify each of the following pages:\n\n{page_texts}"
+
+    return (
+        get_client()
+        .chat.completions.create(
+            model=mg_opts.litellm_model_name,
+            response_model=PageTypes,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt,
+                },
+            ],
+        )
+        .page_types
+    )
+
+
 def collect_relevant_pages(path, min_chars=5, max_front=20, max_back=10):
     # type: (str|Path, int, int, int) -> List[Page]
     """Collect relevant content for Metadata extraction"""
     path = Path(path)
     log.debug(f"{path.name} - Scan for relevant content")
     seen = set()
-    to_collect = ["TITLE_PAGE", "IMPRINT", "TABLE_OF_CONTENTS"]
     other_count = 0
     pages = []
     with fitz.open(path) as doc:
         # Scan start of book
-        for page_number in range(len(doc)):
-            if page_number > 20:
-                log.debug(f"{path.name} - Exhausted the first {max_front} pages")
-                break
-            try:
-                log.debug(f"{path.name} - Extracting page {page_number}")
-                content = pymupdf4llm.to_markdown(doc, pages=[page_number], show_progress=False)
-            except Exception as e:
-                log.error(e)
-                continue
-            if len(content) < min_chars:
-                log.debug(
-                    f"{path.name} - Skip page {page_number} - less than {min_chars} chars ->"
-                    f" {content[:10]}"
-                )
-                continue
-            try:
-                log.debug(f"{path.name} - Classifying page {page_number}")
-                page_type = get_page_type(content, pageno=page_number)
-                log.debug(f"{path.name} - Page {page_number} -> Type {page_type.page_type}")
-            except Exception as e:
-                log.error(e)
-                continue
-            if page_type.page_type in to_collect:
+        front_pages = range(min(max_front, len(doc)))
+        texts = extract_page_texts(doc, front_pages, min_chars)
+        for page_number, page_type in classify_pages(texts).items():
+            if page_type.page_type in COLLECT_PAGE_TYPES:
                 seen.add(page_type.page_type)
+                content = page_markdown(doc, page_number, texts[page_number])
                 pages.append(Page(page_type=page_type, content=content))
-            if page_type.page_type == "OTHER":
+            elif page_type.page_type == "OTHER":
                 other_count += 1
                 if other_count > 8:
                     break
@@ -76,32 +88,117 @@ def collect_relevant_pages(path, min_chars=5, max_front=20, max_back=10):
             return pages
         # Search backward for IMPRINT
         log.debug(f"{path.name} - Scan backwarads for Imprint")
-        for page_number in list(reversed(range(len(doc))))[:max_back]:
+        back_pages = range(len(doc) - 1, max(len(doc) - max_back, 0) - 1, -1)
+        texts = extract_page_texts(doc, back_pages, min_chars)
+        for page_number, page_type in classify_pages(texts).items():
             if "IMPRINT" in seen:
                 return pages
-            try:
-                content = pymupdf4llm.to_markdown(doc, pages=[page_number], show_progress=False)
-            except Exception as e:
-                log.error(e)
-                continue
-            if len(content) < min_chars:
-                log.debug(
-                    f"{path.name} - Skip page {page_number} - less than {min_chars} chars ->"
-                    f" {content[:10]}"
-                )
-                continue
-            try:
-                page_type = get_page_type(content, pageno=page_number)
-                log.debug(f"{path.name} - Page {page_number} -> Type {page_type.page_type}")
-            except Exception as e:
-                log.error(e)
-                continue
-            if page_type.page_type in to_collect:
+            if page_type.page_type in COLLECT_PAGE_TYPES:
                 seen.add(page_type.page_type)
+                content = page_markdown(doc, page_number, texts[page_number])
                 pages.append(Page(page_type=page_type, content=content))
     return pages
 
 
+def extract_page_texts(doc, page_numbers, min_chars=5):
+    # type: (fitz.Document, Iterable[int], int) -> dict[int, str]
+    """
+    Extract the plain text of individual pages for classification.
+
+    Pages that fail to extract or have less than `min_chars` characters are skipped.
+
+    :param doc: Open PDF document
+    :param page_numbers: Numbers of the pages to extract (in scan order)
+    :param min_chars: Minimum number of characters for a page to be kept
+    :return: Mapping of page number to plain text in scan order
+    """
+    name = Path(doc.name).name
+    texts = {}
+    for page_number in page_numbers:
+        try:
+            log.debug(f"{name} - Extracting page {page_number}")
+            text = doc[page_number].get_text("text")
+        except Exception as e:
+            log.error(e)
+            continue
+        if len(text.strip()) < min_chars:
+            log.debug(
+                f"{name} - Skip page {page_number} - less than {min_chars} chars -> {text[:10]}"
+            )
+            continue
+        texts[page_number] = text
+    return texts
+
+
+def page_markdown(doc, page_number, text):
+    # type: (fitz.Document, int, str) -> str
+    """
+    Extract the markdown content of a collected page.
+
+    :param doc: Open PDF document
+    :param page_number: Number of the page to extract
+    :param text: Plain text of the page (returned if markdown extraction fails)
+    :return: Markdown content of the page
+    """
+    try:
+        return pymupdf4llm.to_markdown(
+            doc,
+            pages=[page_number],
+            hdr_info=pymupdf4llm.IdentifyHeaders(doc, pages=[page_number]),
+            show_progress=False,
+        )
+    except Exception as e:
+        log.error(e)
+        return text
+
+
+def classify_pages(contents):
+    # type: (dict[int, str]) -> dict[int, PageType]
+    """
+    Classify page types in batches of `PAGE_BATCH_SIZE` pages per LLM request.
+
+    Batches are classified concurrently with up to `mg_opts.max_concurrency` requests. Pages
+    missing from a batch response are classified individually, pages that still fail to
+    classify are skipped.
+
+    :param contents: Mapping of page number to page text
+    :return: Mapping of page number to page type in the order of `contents`
+    """
+    items = list(contents.items())
+    batches = [dict(items[i : i + PAGE_BATCH_SIZE]) for i in range(0, len(items), PAGE_BATCH_SIZE)]
+    page_types = {}
+    with ThreadPoolExecutor(max_workers=mg_opts.max_concurrency) as executor:
+        for batch_page_types in executor.map(classify_batch, batches):
+            page_types.update(batch_page_types)
+        futures = {
+            page_number: executor.submit(get_page_type, content, pageno=page_number)
+            for page_number, content in contents.items()
+            if page_number not in page_types
+        }
+    for page_number, future in futures.items():
+        try:
+            page_types[page_number] = future.result()
+        except Exception as e:
+            log.error(e)
+    result = {}
+    for page_number in contents:
+        if page_number in page_types:
+            result[page_number] = page_types[page_number]
+            log.debug(f"Page {page_number} -> Type {result[page_number].page_type}")
+    return result
+
+
+def classify_batch(contents):
+    # type: (dict[int, str]) -> dict[int, PageType]
+    """Classify a batch of pages with one request (empty result if the request fails)"""
+    try:
+        page_types = get_page_types(contents)
+    except Exception as e:
+        log.error(e)
+        return {}
+    return {pt.page_number: pt for pt in page_types if pt.page_number in contents}
+
+
 if __name__ == "__main__":
     from rich import print
 
@@ -1,4 +1,5 @@
-from functools import cache
+import hashlib
+import threading
 
 import pymupdf
 import pymupdf4llm
@@ -6,18 +7,26 @@ from loguru import logger as log
 from pathlib import Path
 from pymupdf import Document
 import io
-from PIL import Image
+from iscc_metagen.cache import cache_get, cache_key, cache_put
 from iscc_metagen.settings import mg_opts
 
+# Maximum width and height of extracted cover images in pixels
+COVER_SIZE = 1536
+# Number of recent extractions kept in memory (keyed by content digest, not content)
+MEMORY_CACHE_SIZE = 16
+
+MEMORY_CACHE = {}  # type: dict[tuple[str, int, int, int], str]
+MEMORY_CACHE_LOCK = threading.Lock()
+
 
 def pdf_open(doc):
-    # type: (str|Path|Document) -> Document
+    # type: (str|Path|bytes|Document) -> Document
     """
-    Open a PDF file or return an already opened PDF Document object.
+    Open a PDF file or in-memory PDF data or return an already opened PDF Document object.
 
-    :param doc: File path as string or Path, or an open Document object
+    :param doc: File path as string or Path, PDF file content as bytes, or an open Document object
     :return: An open Document object
-    :raises TypeError: If input is not a string, Path, or Document object
+    :raises TypeError: If input is not a string, Path, bytes, or Document object
     """
     if isinstance(doc, (str, Path)):
         doc = Path(doc)
@@ -25,14 +34,32 @@ def pdf_open(doc):
         doc = pymupdf.open(doc)
         doc.filename = filename
         log.info("Opened file with PDF processor")
+    elif isinstance(doc, bytes):
+        doc = pymupdf.open(stream=doc, filetype="pdf")
+        log.info("Opened in-memory data with PDF processor")
     elif not isinstance(doc, Document):
-        raise TypeError("Input must be a string, Path, or Document object")
+        raise TypeError("Input must be a string, Path, bytes, or Document object")
     return doc
 
 
-@cache
+def pdf_digest(doc):
+    # type: (str|Path|bytes|Document) -> str|None
+    """
+    Compute the SHA-256 hex digest of the PDF file content.
+
+    :param doc: File path as string or Path, PDF file content as bytes, or an open Document object
+    :return: Hex encoded digest or None for an already opened Document object
+    """
+    if isinstance(doc, bytes):
+        return hashlib.sha256(doc).hexdigest()
+    if isinstance(doc, (str, Path)):
+        with open(doc, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    return None
+
+
 def pdf_extract_pages(doc, first=None, middle=None, last=None):
-    # type: (str|Path|Document, int|None, int|None, int|None) -> str
+    # type: (str|Path|bytes|Document, int|None, int|None, int|None) -> str
     """
     Extract relevant pages as a single Markdown text
 
@@ -42,12 +69,52 @@ def pdf_extract_pages(doc, first=None, middle=None, last=None):
     :param last: Number of pages to extract from the back (overrides settings if provided)
     :return: Extracted pages as Markdown text
     """
-    doc = pdf_open(doc)
-
     first = first if first is not None else mg_opts.front_pages
     middle = middle if middle is not None else mg_opts.mid_pages
     last = last if last is not None else mg_opts.back_pages
 
+    # Cache results by file content in memory and on disk (opened Documents are not cached)
+    digest = pdf_digest(doc)
+    if digest is None:
+        return pdf_extract_markdown(pdf_open(doc), first, middle, last)
+    memory_key = (digest, first, middle, last)
+    with MEMORY_CACHE_LOCK:
+        text_md = MEMORY_CACHE.get(memory_key)
+    if text_md is not None:
+        return text_md
+
+    key = cache_key({"digest": digest, "pages": [first, middle, last]})
+    data = cache_get(key) if mg_opts.cache_enabled else None
+    if data is not None:
+        log.info("Using cached markdown extraction")
+        text_md = data.decode("utf-8")
+    else:
+        text_md = pdf_extract_markdown(pdf_open(doc), first, middle, last)
+        if mg_opts.cache_enabled:
+            try:
+                cache_put(key, text_md.encode("utf-8"))
+            except OSError as e:
+                log.warning(f"Failed to cache markdown extraction: {e}")
+
+    with MEMORY_CACHE_LOCK:
+        if len(MEMORY_CACHE) >= MEMORY_CACHE_SIZE:
+            # Evict the oldest entry (dicts keep insertion order)
+            del MEMORY_CACHE[next(iter(MEMORY_CACHE))]
+        MEMORY_CACHE[memory_key] = text_md
+    return text_md
+
+
+def pdf_extract_markdown(doc, first, middle, last):
+    # type: (Document, int, int, int) -> str
+    """
+    Extract pages from the front, middle and back of an open PDF as a single Markdown text.
+
+    :param doc: Open PDF document to extract pages from
+    :param first: Number of pages to extract from the front
+    :param middle: Number of pages to extract from the middle
+    :param last: Number of pages to extract from the back
+    :return: Extracted pages as Markdown text
+    """
     total_pages = doc.page_count
     requested_pages = first + middle + last
 
@@ -65,6 +132,8 @@ def pdf_extract_pages(doc, first=None, middle=None, last=None):
     text_md = pymupdf4llm.to_markdown(
         doc,
         pages=page_numbers,
+        # Detect header font sizes on the extracted pages only instead of scanning the whole PDF
+        hdr_info=pymupdf4llm.IdentifyHeaders(doc, pages=page_numbers),
         embed_images=False,
         page_chunks=False,
         show_progress=False,
@@ -75,33 +144,60 @@ def pdf_extract_pages(doc, first=None, middle=None, last=None):
 
 
 def pdf_extract_cover(doc):
-    # type: (str|Path|Document) -> io.BytesIO|None
+    # type: (str|Path|bytes|Document) -> io.BytesIO|None
     """
-    Extract the first page of a PDF as a cover image, resized if necessary.
+    Extract the first page of a PDF as a cover image, scaled to fit into COVER_SIZE pixels.
 
-    :param doc: File path as string or Path, or an open Document object
+    :param doc: File path as string or Path, PDF file content as bytes, or an open Document object
     :return: An in-memory image object (BytesIO) or None if extraction fails
     """
     doc = pdf_open(doc)
     log.info(f"Extracting cover image")
     try:
         first_page = doc[0]
-        pix = first_page.get_pixmap(matrix=pymupdf.Matrix(2, 2))  # Scale up for better quality
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-
-        # Resize the image if it's larger than 1536x1536
-        if img.width > 1536 or img.height > 1536:
-            img.thumbnail((1536, 1536))
-
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format="PNG")
-        img_byte_arr.seek(0)
-        return img_byte_arr
+        image = pdf_embedded_cover(doc, first_page)
+        if image is not None:
+            return io.BytesIO(image)
+        # Render at 2x for better quality but no larger than COVER_SIZE on the longest side
+        zoom = min(2.0, COVER_SIZE / max(first_page.rect.width, first_page.rect.height))
+        pix = first_page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+        return io.BytesIO(pix.tobytes("png"))
     except Exception as e:
         log.error(f"Failed to extract cover image: {e}")
         return None
 
 
+def pdf_embedded_cover(doc, page):
+    # type: (Document, pymupdf.Page) -> bytes|None
+    """
+    Return the stored image of a page that consists of a single full-page image (scanned cover).
+
+    Only opaque JPEG or PNG images with grayscale or RGB color that fit into COVER_SIZE are
+    returned as is. Pages with text, vector drawings or rotation are rendered as well, because
+    the stored image lacks the overlaid content and orientation.
+
+    :param doc: Open PDF document
+    :param page: Page to extract the image from
+    :return: Encoded image data or None if the page has to be rendered
+    """
+    if page.rotation != 0 or page.get_text().strip() or page.get_drawings():
+        return None
+    images = page.get_images(full=True)
+    if len(images) != 1:
+        return None
+    xref, smask, width, height = images[0][:4]
+    if smask or max(width, height) > COVER_SIZE:
+        return None
+    rects = page.get_image_rects(xref)
+    if len(rects) != 1 or (rects[0] & page.rect).get_area() < 0.95 * page.rect.get_area():
+        return None
+    image = doc.extract_image(xref)
+    if image["ext"] not in ("jpeg", "png") or image["colorspace"] not in (1, 3):
+        return None
+    log.info("Using embedded cover image")
+    return image["image"]
+
+
 if __name__ == "__main__":
     here = Path(__file__).parent
     text = pdf_extract_pages(here.parent / ".data/test1.pdf")
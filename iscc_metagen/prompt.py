@@ -4,6 +4,13 @@ import inspect
 import textwrap
 from jinja2 import Environment, StrictUndefined
 
+JINJA_ENV = Environment(
+    trim_blocks=True,
+    lstrip_blocks=True,
+    keep_trailing_newline=True,
+    undefined=StrictUndefined,
+)
+
 
 def make_prompt(fn) -> str:
     """Decorate a function that contains a prompt template.
@@ -16,18 +23,13 @@ def make_prompt(fn) -> str:
         raise TypeError("Could not find a template in the function's docstring.")
 
     signature = inspect.signature(fn)
+    # Compile the template once at decoration time instead of on every render
+    jinja_template = JINJA_ENV.from_string(template)
 
     @functools.wraps(fn)
     def wrapper(*args, **kwargs):
         bound_arguments = signature.bind(*args, **kwargs)
         bound_arguments.apply_defaults()
-        env = Environment(
-            trim_blocks=True,
-            lstrip_blocks=True,
-            keep_trailing_newline=True,
-            undefined=StrictUndefined,
-        )
-        jinja_template = env.from_string(template)
         return jinja_template.render(**bound_arguments.arguments)
 
     return wrapper
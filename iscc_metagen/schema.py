@@ -2,6 +2,7 @@
 from typing import Literal, Optional, Annotated
 from pydantic import BaseModel, Field, HttpUrl, conint, AfterValidator, field_validator
 from pydantic.json_schema import SkipJsonSchema
+from instructor.dsl.partial import PartialLiteralMixin
 from pydantic_extra_types.language_code import LanguageAlpha2
 from pydantic_extra_types.isbn import ISBN
 
@@ -49,6 +50,20 @@ class BookMetadata(BaseModel):
     #     return v
 
 
+class StreamedBookMetadata(BookMetadata, PartialLiteralMixin):
+    """Metadata about a Book. Provide metadata in the same language as the book is written in!"""
+
+    # Partial results only include completed strings (PartialLiteralMixin) so typed fields like
+    # URLs or ISBNs validate while streaming. They are validated before all keywords arrived, so
+    # the keyword bounds are only advertised in the JSON schema here. Final results are validated
+    # as BookMetadata.
+    keywords: list[str] = Field(
+        ...,
+        description="Keywords that apply to the books topic",
+        json_schema_extra={"minItems": 3, "maxItems": 7},
+    )
+
+
 class PageType(BaseModel):
     """
     Classify the page-type of a book page. Also take note of the page-number when predicting the page type.
@@ -70,6 +85,12 @@ class PageType(BaseModel):
     page_number: int = Field(..., description="The page number")
 
 
+class PageTypes(BaseModel):
+    """Classify the page-types of multiple book pages (one classification per page)."""
+
+    page_types: list[PageType] = Field(..., description="The page-type of each page.")
+
+
 class Page(BaseModel):
     page_type: PageType
     content: str = Field(..., description="Markdown representation of the pages textual content")
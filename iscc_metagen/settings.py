@@ -1,22 +1,38 @@
+from pathlib import Path
+from typing import Literal
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from instructor.mode import Mode
 
+DEFAULT_MODEL = "ollama/qwen2.5:7b-instruct-q8_0"
+
 
 class MetaGenSettings(BaseSettings):
     litellm_model_name: str = Field(
-        "ollama/qwen2.5:7b-instruct-q8_0", description="Default Litellm model used for inference"
+        DEFAULT_MODEL, description="Default Litellm model used for inference"
     )
     litellm_models: list[str] = Field(
-        [litellm_model_name], description="List of available litellm models"
+        [DEFAULT_MODEL], description="List of available litellm models"
     )
     fastembed_model_name: str = Field(
         "nomic-ai/nomic-embed-text-v1.5-Q", description="Embeddding model name"
     )
     instructor_mode: Mode = Field(Mode.TOOLS, description="Instructor tool calling mode")
     max_retries: int = Field(3, description="Max retries to generate a valid response")
+    max_concurrency: int = Field(4, ge=1, description="Max number of concurrent LLM requests")
+    min_descend_confidence: Literal["LOW", "MEDIUM", "HIGH"] = Field(
+        "MEDIUM", description="Min confidence of a Thema subcategory to descend into it"
+    )
+    cache_enabled: bool = Field(True, description="Cache deterministic LLM responses on disk")
+    cache_dir: Path = Field(
+        Path.home() / ".cache" / "iscc-metagen", description="Directory for cached results"
+    )
+    cache_ttl: int = Field(
+        30 * 24 * 60 * 60, description="Seconds until cached results expire (0 = never)"
+    )
     ollama_num_ctx: int = Field(8192, description="Default context size for loading Ollama models")
     ollama_num_gpu: int = Field(100, description="The number of layers to send to the GPU(s).")
+    ollama_num_batch: int = Field(256, description="Prompt processing batch size for Ollama models")
     front_pages: int = Field(
         8, description="Number of pages to extract from the front of the document"
     )
@@ -36,11 +52,12 @@ class MetaGenSettings(BaseSettings):
 
     def override(self, update=None):
         # type: (dict|None) -> SctOptions
-        """Returns an updated and validated deep copy of the current settings instance."""
+        """Returns an updated and validated copy of the current settings instance."""
 
         update = update or {}  # sets {} if update is None
 
-        opts = self.model_copy(deep=True)
+        # All other fields are immutable, so a shallow copy only needs its own list of models
+        opts = self.model_copy(update={"litellm_models": list(self.litellm_models)})
         # We need update fields individually so validation gets triggered
         for field, value in update.items():
             setattr(opts, field, value)
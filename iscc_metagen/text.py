@@ -1,9 +1,42 @@
 """Functions for plain-text manipulation"""
 
+import re
+from pydantic_core import PydanticCustomError
+from pydantic_extra_types.isbn import ISBN
+
+# ISBN-13 candidates, or ISBN-10 candidates if labeled as ISBN (bare 10 digit numbers are too
+# ambiguous), with optional hyphen/space separators between digits
+ISBN_PATTERN = re.compile(
+    r"(?<![\dX])(97[89](?:[- ]?\d){10})(?![\dX])|ISBN(?:-?10)?:?\s*((?:\d[- ]?){9}[\dX])(?![\dX])",
+    re.IGNORECASE,
+)
+
 
 def text_extract_parts(text, num_chars=1000):
     # type: (str, int) -> tuple[str, str, str]
     """Dynamically extract start, middle, and end chunks from text based on available context size"""
+    # Overlapping chunks would only repeat content, so short texts are returned whole
+    if 3 * num_chars >= len(text):
+        return text, "", ""
     middle = len(text) // 2
     s, m, e = text[:num_chars], text[middle : middle + num_chars], text[-num_chars:]
     return s, m, e
+
+
+def text_find_isbns(text):
+    # type: (str) -> list[str]
+    """
+    Find ISBNs with valid check digits in text.
+
+    :param text: Text to search
+    :return: Unique ISBN-13 numbers in order of appearance
+    """
+    isbns = {}
+    for match in ISBN_PATTERN.finditer(text):
+        candidate = (match[1] or match[2]).replace("-", "").replace(" ", "").upper()
+        try:
+            ISBN.validate_isbn_format(candidate)
+        except PydanticCustomError:
+            continue
+        isbns[ISBN.convert_isbn10_to_isbn13(candidate)] = None
+    return list(isbns)
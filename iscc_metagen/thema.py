@@ -34,20 +34,25 @@ Steps:
     - Return only the most specific categories from each branch
 """
 
+import asyncio
+from collections.abc import AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from pydantic.json_schema import SkipJsonSchema
 from pymupdf import Document
 from loguru import logger as log
-from functools import cached_property
-from typing import Annotated, List, Literal
-import httpx_cache
-from pydantic import BaseModel, BeforeValidator, Field
+from functools import cache, cached_property
+from dataclasses import dataclass
+from typing import List, Literal
+from pydantic import BaseModel, Field
+from pydantic_core import from_json
 import pathlib
 import json
+import sys
 from iscc_metagen.utils import timer
 from iscc_metagen.prompt import make_prompt
-from iscc_metagen.client import client
+from iscc_metagen.client import get_aclient, get_client
 from iscc_metagen.pdf import pdf_extract_pages
 from iscc_metagen.settings import mg_opts
 
@@ -57,43 +62,49 @@ THEMA_VERSION = "1.5"
 THEMA_JSON_URL = "https://www.editeur.org/files/Thema/1.5/v1.5_en/20230707_Thema_v1.5_en.json"
 THEMA_PATH = HERE / "thema.json"
 NAMESPACE = "6ba7b811-9dad-11d1-80b4-00c04fd430c8"
+SYSTEM_PROMPT = "You are a helpful assistant that selects Thema categories for books."
+# Model prefixes of providers that require explicit prompt caching markers
+ANTHROPIC_PREFIXES = ("anthropic/", "claude-")
+# Confidence levels of selected categories in ascending order
+CONFIDENCE_LEVELS = ("LOW", "MEDIUM", "HIGH")
+
+
+# Mapping of Thema JSON keys to ThemaCode fields (in field order)
+THEMA_CODE_KEYS = (
+    "CodeValue",
+    "CodeDescription",
+    "CodeNotes",
+    "CodeParent",
+    "IssueNumber",
+    "Modified",
+)
+# Short key fields repeated across codes (parents, issue numbers, dates) that are worth interning
+THEMA_INTERN_KEYS = frozenset(("CodeValue", "CodeParent", "IssueNumber", "Modified"))
+
+
+@dataclass(slots=True)
+class ThemaCode:
+    """
+    A Thema category code.
 
+    Plain dataclass instead of a pydantic model: the canonical EDItEUR data is trusted and
+    thousands of codes are constructed on load.
+    """
 
-# Thema JSON has a mix of number and string values for some of the fields
-Str = Annotated[str, BeforeValidator(str)]
-
-
-class ThemaCode(BaseModel):
-    category_code: Str = Field(
-        alias="CodeValue", description="The unique code value for the Thema category"
-    )
-    category_heading: str = Field(
-        alias="CodeDescription", description="The descriptive heading for the Thema category"
-    )
-    code_notes: str = Field(
-        alias="CodeNotes",
-        default="",
-        description="Additional notes or information about the Thema category",
-    )
-    parent_code: Str = Field(
-        alias="CodeParent",
-        default="",
-        description="The parent code of this category in the Thema hierarchy",
-    )
-    issue_number: Str = Field(
-        alias="IssueNumber",
-        default="",
-        description="The issue number of the Thema version this code belongs to",
-    )
-    modified: Str = Field(
-        alias="Modified", default="", description="The modification version of this Thema code"
-    )
-    full_heading: str = Field(
-        default="", description="The full forward slash separated path of the parent headings"
-    )
-
-    class Config:
-        populate_by_name = True
+    # The unique code value for the Thema category
+    category_code: str
+    # The descriptive heading for the Thema category
+    category_heading: str
+    # Additional notes or information about the Thema category
+    code_notes: str = ""
+    # The parent code of this category in the Thema hierarchy
+    parent_code: str = ""
+    # The issue number of the Thema version this code belongs to
+    issue_number: str = ""
+    # The modification version of this Thema code
+    modified: str = ""
+    # The full forward slash separated path of the parent headings
+    full_heading: str = ""
 
     def render_simple(self) -> str:
         """
@@ -120,138 +131,297 @@ class ThemaSelection(BaseModel):
 class ThemaCategories(BaseModel):
     """A list of Thema categories relevant to the document"""
 
-    categories: List[ThemaSelection] = Field(..., min_items=0, max_items=3)
+    categories: List[ThemaSelection] = Field(..., min_length=0, max_length=3)
     response_cost: SkipJsonSchema[float] = Field(0.0, description="Response cost in USD")
 
 
 class Thema:
     def __init__(self):
-        self.data = load_thema_json()
-        self.codes = parse_thema_codes(self.data)
+        # The raw JSON tree is only needed for parsing and is not kept alive
+        self.codes = parse_thema_codes(load_thema_json())
         self.db = {code.category_code: code for code in self.codes}
+        self.children = {}
+        for code in self.codes:
+            if code.parent_code != code.category_code:
+                self.children.setdefault(code.parent_code, []).append(code)
 
     def get(self, category_code: str) -> ThemaCode:
         return self.db.get(category_code)
 
+    def full_heading(self, category_code: str) -> str:
+        """Returns the full heading for a category code (or the code itself if it is unknown)"""
+        code = self.db.get(category_code)
+        return code.full_heading if code else category_code
+
     @cached_property
     def main_subjects(self) -> list[ThemaCode]:
         """Returns a list of main subject headings"""
+        # Main subjects are top-level codes, the remaining top-level codes are qualifiers
         return [
             code
-            for code in self.codes
+            for code in self.children.get("", [])
             if len(code.category_code) == 1 and code.category_code.isalpha()
         ]
 
     def sub_categories(self, parent: ThemaCode) -> list[ThemaCode]:
         """Returns a list of sub categories headings for a given category"""
-        parent_code = parent.category_code
-        return [
-            code
-            for code in self.codes
-            if code.parent_code == parent_code and code.category_code != parent_code
-        ]
+        return self.children.get(parent.category_code, [])
 
 
 def predict_categories(doc):
-    # type: (str|Path|Document) -> ThemaCategories
+    # type: (str|Path|bytes|Document) -> ThemaCategories
     """
     Predict Thema Main Categories for a document.
 
-    :param doc: The document to analyze (file path or Document object)
+    :param doc: The document to analyze (file path, file content or Document object)
     :return: ThemaCategories object containing the predicted categories
     """
-    return predict_categories_recursive(doc, thema_db)
+    return predict_categories_recursive(doc, get_thema())
 
 
 def predict_categories_recursive(doc, thema):
-    # type: (str|Path|Document, Thema) -> ThemaCategories
+    # type: (str|Path|bytes|Document, Thema) -> ThemaCategories
     """
     Predict Thema categories for a document using the Top-Down LLM based Iterative Selection strategy.
 
-    :param doc: The document to analyze (file path or Document object)
+    :param doc: The document to analyze (file path, file content or Document object)
     :param thema: Thema object containing category data
     :return: ThemaCategories object containing the predicted categories and total response cost
     """
     # Extract pages from the document
-    pages = pdf_extract_pages(
-        doc, first=mg_opts.front_pages, middle=mg_opts.mid_pages, last=mg_opts.back_pages
+    pages = pdf_extract_pages(doc)
+
+    top_level_categories, total_cost = select_categories(pages, thema.main_subjects, thema)
+
+    # Branches are independent once the main categories are selected, so refine them in parallel
+    with ThreadPoolExecutor(max_workers=mg_opts.max_concurrency) as executor:
+        futures = [
+            executor.submit(select_branch, pages, category, thema)
+            for category in top_level_categories
+        ]
+        branches = [future.result() for future in futures]
+
+    # Add only the deepest category from each branch
+    final_categories = [category for category, _ in branches]
+    total_cost += sum(cost for _, cost in branches)
+    return ThemaCategories(
+        categories=final_categories[:4], response_cost=total_cost
+    )  # Limit to top 4 categories
+
+
+def select_categories(pages, categories, thema):
+    # type: (str, list[ThemaCode], Thema) -> tuple[list[ThemaSelection], float]
+    """
+    Select the most relevant categories for document pages from a list of candidates.
+
+    :param pages: Extracted document pages
+    :param categories: Candidate Thema categories
+    :param thema: Thema object containing category data
+    :return: Selected categories and response cost
+    """
+    response, model_response = get_client().chat.completions.create_with_completion(
+        model=mg_opts.litellm_model_name,
+        messages=category_messages(pages, categories),
+        response_model=ThemaCategories,
+        max_retries=mg_opts.max_retries,
     )
+    log_candidates(response.categories, thema)
+    return response.categories, model_response._hidden_params.get("response_cost") or 0.0
+
 
+def select_branch(pages, category, thema):
+    # type: (str, ThemaSelection, Thema) -> tuple[ThemaSelection, float]
+    """
+    Refine a selected category to its most specific relevant subcategory.
+
+    :param pages: Extracted document pages
+    :param category: Selected category to refine
+    :param thema: Thema object containing category data
+    :return: Deepest selected category of the branch and total response cost
+    """
     total_cost = 0.0
+    subcategories = branch_subcategories(category, thema)
+    while subcategories:
+        log.debug(f"Selecting subcategories for {category.category_code}")
+        selected, response_cost = select_categories(pages, subcategories, thema)
+        total_cost += response_cost
+        if not selected or not is_confident(selected[0]):
+            break
+        category = selected[0]  # Keep only the most relevant subcategory
+        subcategories = branch_subcategories(category, thema)
+    return category, total_cost
+
 
-    def select_categories(categories):
-        # type: (list[ThemaCode]) -> list[ThemaSelection]
-        nonlocal total_cost
-        category_list = "\n".join(
-            [f"{code.category_code}: {code.category_heading}" for code in categories]
-        )
-        prompt = prompt_select_category(pages=pages, categories=category_list)
-
-        response, model_response = client.chat.completions.create_with_completion(
-            model=mg_opts.litellm_model_name,
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a helpful assistant that selects Thema categories for books."
-                    ),
-                },
-                {"role": "user", "content": prompt},
-            ],
-            response_model=ThemaCategories,
-            max_retries=mg_opts.max_retries,
-        )
-        response_cost = model_response._hidden_params.get("response_cost", 0.0)
+async def apredict_categories(doc):
+    # type: (str|Path|bytes|Document) -> ThemaCategories
+    """
+    Predict Thema categories for a document using the async LLM client.
+
+    Follows the same Top-Down Iterative Selection strategy as `predict_categories` but refines
+    the branches of all selected main categories concurrently.
+
+    :param doc: The document to analyze (file path, file content or Document object)
+    :return: ThemaCategories object containing the predicted categories and total response cost
+    """
+    thema = get_thema()
+    pages = await asyncio.to_thread(pdf_extract_pages, doc)
+    top_level_categories, total_cost = await aselect_categories(pages, thema.main_subjects, thema)
+    branches = await asyncio.gather(
+        *[aselect_branch(pages, category, thema) for category in top_level_categories]
+    )
+    final_categories = [category for category, _ in branches]
+    total_cost += sum(cost for _, cost in branches)
+    return ThemaCategories(categories=final_categories[:4], response_cost=total_cost)
+
+
+async def apredict_categories_batch(docs):
+    # type: (list[str|Path]) -> AsyncIterator[tuple[str|Path, ThemaCategories|Exception]]
+    """
+    Predict Thema categories for multiple documents concurrently.
+
+    At most `mg_opts.max_concurrency` documents are processed at the same time. Results are
+    yielded in order of completion. Failures are yielded as exceptions.
+
+    :param docs: Paths to the PDF files.
+    :return: Async iterator of (document, categories or exception) tuples.
+    """
+    semaphore = asyncio.Semaphore(mg_opts.max_concurrency)
+    tasks = [apredict_bounded(doc, semaphore) for doc in docs]
+    for task in asyncio.as_completed(tasks):
+        yield await task
+
+
+async def apredict_bounded(doc, semaphore):
+    # type: (str|Path, asyncio.Semaphore) -> tuple[str|Path, ThemaCategories|Exception]
+    """
+    Predict Thema categories for a single document while holding the batch semaphore.
+
+    :param doc: Path to the PDF file.
+    :param semaphore: Semaphore limiting the number of concurrent predictions.
+    :return: Tuple of document and predicted categories or the exception raised.
+    """
+    async with semaphore:
+        try:
+            return doc, await apredict_categories(doc)
+        except Exception as e:
+            log.error(f"Failed to predict Thema categories for {doc}: {e}")
+            return doc, e
+
+
+async def aselect_categories(pages, categories, thema):
+    # type: (str, list[ThemaCode], Thema) -> tuple[list[ThemaSelection], float]
+    """
+    Select the most relevant categories for document pages using the async LLM client.
+
+    :param pages: Extracted document pages
+    :param categories: Candidate Thema categories
+    :param thema: Thema object containing category data
+    :return: Selected categories and response cost
+    """
+    response, model_response = await get_aclient().chat.completions.create_with_completion(
+        model=mg_opts.litellm_model_name,
+        messages=category_messages(pages, categories),
+        response_model=ThemaCategories,
+        max_retries=mg_opts.max_retries,
+    )
+    log_candidates(response.categories, thema)
+    return response.categories, model_response._hidden_params.get("response_cost") or 0.0
+
+
+async def aselect_branch(pages, category, thema):
+    # type: (str, ThemaSelection, Thema) -> tuple[ThemaSelection, float]
+    """
+    Refine a selected category to its most specific relevant subcategory using the async client.
+
+    :param pages: Extracted document pages
+    :param category: Selected category to refine
+    :param thema: Thema object containing category data
+    :return: Deepest selected category of the branch and total response cost
+    """
+    total_cost = 0.0
+    subcategories = branch_subcategories(category, thema)
+    while subcategories:
+        log.debug(f"Selecting subcategories for {category.category_code}")
+        selected, response_cost = await aselect_categories(pages, subcategories, thema)
         total_cost += response_cost
-        for cat in response.categories:
-            log.debug(
-                f"Candidate -> {cat.category_code} -"
-                f" {thema.get(cat.category_code).category_heading}"
-            )
-        return response.categories
+        if not selected or not is_confident(selected[0]):
+            break
+        category = selected[0]  # Keep only the most relevant subcategory
+        subcategories = branch_subcategories(category, thema)
+    return category, total_cost
 
-    def select_subcategories(parent_category):
-        # type: (ThemaSelection) -> list[ThemaSelection]
-        subcategories = thema.sub_categories(thema.db[parent_category.category_code])
-        if not subcategories:
-            return []
 
-        log.debug(f"Selecting subcategories for {parent_category.category_code}")
-        selected = select_categories(subcategories)
+def branch_subcategories(category, thema):
+    # type: (ThemaSelection, Thema) -> list[ThemaCode]
+    """Returns the subcategories of a selected category (none if the code is unknown)."""
+    code = thema.get(category.category_code)
+    return thema.sub_categories(code) if code else []
 
-        if not selected:
-            return []
 
-        result = [selected[0]]  # Keep only the most relevant subcategory
-        deeper_subcategories = select_subcategories(selected[0])
-        return result + deeper_subcategories
+def is_confident(selection):
+    # type: (ThemaSelection) -> bool
+    """Check if a selected subcategory is confident enough to descend into its branch."""
+    min_level = CONFIDENCE_LEVELS.index(mg_opts.min_descend_confidence)
+    return CONFIDENCE_LEVELS.index(selection.confidence) >= min_level
 
-    top_level_categories = select_categories(thema.main_subjects)
-    final_categories = []
 
-    for category in top_level_categories:
-        branch = [category] + select_subcategories(category)
-        final_categories.append(branch[-1])  # Add only the deepest category from each branch
+def log_candidates(categories, thema):
+    # type: (list[ThemaSelection], Thema) -> None
+    """Log selected candidate categories with their full headings."""
+    for cat in categories:
+        log.debug(f"Candidate -> {cat.category_code} - {thema.full_heading(cat.category_code)}")
 
-    return ThemaCategories(
-        categories=final_categories[:4], response_cost=total_cost
-    )  # Limit to top 4 categories
+
+def category_messages(pages, categories):
+    # type: (str, list[ThemaCode]) -> list[dict]
+    """
+    Build the chat messages for selecting Thema categories from a list of candidates.
+
+    The document excerpts are identical for all selection steps of a document, so they lead the
+    prompt as a stable prefix for provider-side prompt caching, followed by the candidates.
+
+    :param pages: Extracted document pages
+    :param categories: Candidate Thema categories
+    :return: Chat messages
+    """
+    excerpts = prompt_document_excerpts(pages=pages)
+    category_list = "\n".join(
+        [f"{code.category_code}: {code.category_heading}" for code in categories]
+    )
+    selection = prompt_select_category(categories=category_list)
+    if mg_opts.litellm_model_name.startswith(ANTHROPIC_PREFIXES):
+        # Anthropic only caches prompt prefixes that are explicitly marked
+        content = [
+            {"type": "text", "text": excerpts, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": selection},
+        ]
+    else:
+        content = excerpts + selection
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": content},
+    ]
 
 
 @make_prompt
-def prompt_select_category(pages, categories) -> str:
+def prompt_document_excerpts(pages) -> str:
     """
     You are tasked with selecting the most relevant Thema categories for a document based on
     excerpts from its beginning, middle, and end. Your goal is to choose 0 to 3 categories that
     best represent the document's content, ensuring the first category is the most relevant.
 
+    Carefully read the following excerpts from the document:
+    {{ pages }}
+    """
+
+
+@make_prompt
+def prompt_select_category(categories) -> str:
+    """
     Here is the list of Thema categories to choose from:
     {{ categories }}
 
-    Now, carefully read the following excerpts from the document:
-    {{ pages }}
-
-    Analyze these excerpts to understand the main themes, topics, and focus of the document.
+    Analyze the excerpts to understand the main themes, topics, and focus of the document.
     Consider the following:
     1. What are the primary subjects discussed?
     2. Are there any recurring themes or ideas?
@@ -275,10 +445,11 @@ def load_thema_json():
     """Load original Thema JSON"""
     try:
         with timer("Loading thema json from disk"):
-            with open(THEMA_PATH, "rt", encoding="utf-8") as f:
-                return json.load(f)
+            return from_json(THEMA_PATH.read_bytes())
     except Exception as e:
         log.warning(f"Error loading thema json from disk: {e}")
+        import httpx_cache
+
         with timer("Loading Thema Json"):
             with httpx_cache.Client(cache=httpx_cache.FileCache(), always_cache=True) as client:
                 return client.get(THEMA_JSON_URL).json()
@@ -295,27 +466,58 @@ def parse_thema_codes(data):
     """Parse Thema codes from raw JSON data"""
     with timer("Parsing Thema Codes"):
         codes = data["CodeList"]["ThemaCodes"]["Code"]
-        thema_codes = [ThemaCode.model_validate(code) for code in codes]
+        thema_codes = [ThemaCode(*thema_code_values(code)) for code in codes]
 
         # Create a dictionary for quick lookup
         code_dict = {code.category_code: code for code in thema_codes}
 
         # Populate full_heading field
         for code in thema_codes:
-            full_heading = []
-            current_code = code
-            while current_code:
-                full_heading.insert(0, current_code.category_heading)
-                if current_code.parent_code:
-                    current_code = code_dict.get(current_code.parent_code)
-                else:
-                    break
-            code.full_heading = " / ".join(full_heading)
+            thema_full_heading(code, code_dict)
 
         return thema_codes
 
 
-thema_db = Thema()
+def thema_code_values(code):
+    # type: (dict) -> list[str]
+    """
+    Convert the raw JSON fields of a Thema code to strings in `ThemaCode` field order.
+
+    Thema JSON has a mix of number and string values for some of the fields. Interning shares
+    the few distinct values of the short key fields (e.g. issue numbers) among all codes.
+    """
+    values = []
+    for key in THEMA_CODE_KEYS:
+        value = str(code.get(key, ""))
+        values.append(sys.intern(value) if key in THEMA_INTERN_KEYS else value)
+    return values
+
+
+def thema_full_heading(code, code_dict):
+    # type: (ThemaCode, dict[str, ThemaCode]) -> str
+    """
+    Compute and store the full heading of a Thema code.
+
+    Headings already stored on ancestors are reused, so each code is only resolved once.
+
+    :param code: Thema code to resolve
+    :param code_dict: Lookup of Thema codes by category code
+    :return: Forward slash separated path of the parent headings
+    """
+    if not code.full_heading:
+        parent = code_dict.get(code.parent_code)
+        if parent is None or parent is code:
+            code.full_heading = code.category_heading
+        else:
+            code.full_heading = f"{thema_full_heading(parent, code_dict)} / {code.category_heading}"
+    return code.full_heading
+
+
+@cache
+def get_thema():
+    # type: () -> Thema
+    """Load and parse the Thema categories once on first use."""
+    return Thema()
 
 
 if __name__ == "__main__":
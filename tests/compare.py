@@ -1,82 +1,514 @@
-import fitz
+import asyncio
+import hashlib
+import httpx
+import instructor
+import json
 import ollama
+import openai
+import os
+import platform
+import subprocess
+import sys
 import time
+from datetime import datetime, timezone
+from functools import cache
+from pathlib import Path
 from loguru import logger as log
-from iscc_metagen.main import generate_metadata
-from rich import print
+from importlib.metadata import PackageNotFoundError, version
+from typing import NamedTuple
+from instructor.core import InstructorRetryException
+from iscc_metagen.cache import cache_get, cache_key, cache_put
+from iscc_metagen.client import add_ollama_options
+from iscc_metagen.main import metadata_messages
+from iscc_metagen.schema import BookMetadata
+from iscc_metagen.settings import mg_opts
 from rich.table import Table
 from rich.console import Console
 
+try:
+    VERSION = version("iscc-metagen")
+except PackageNotFoundError:
+    VERSION = "unknown"
 
-ignore = {
-    "command-r:35b-v0.1-q3_K_S",
-    "aya:35b-23-q3_K_S",
-    "nextfire/paraphrase-multilingual-minilm:latest",
-    "mxbai-embed-large:latest",
-    "nomic-embed-text:latest",
-}
+# Raw results of all runs are appended to this file (JSON Lines)
+RESULTS_PATH = "compare-results.jsonl"
+# Statuses of runs measured in the current invocation (cached and skipped runs are not exported)
+MEASURED_STATUSES = frozenset(("Success", "Failed", "Timeout"))
+# Model families of embedding models, which cannot generate metadata
+EMBEDDING_FAMILIES = frozenset(("bert", "nomic-bert"))
+# Weights plus headroom for KV cache and runtime buffers
+MEMORY_SLACK = 1.2
+# Context length assumed if the model does not report it
+DEFAULT_CONTEXT = 4096
+# Tokens reserved for the JSON schema instructions and the generated response
+RESPONSE_TOKENS = 1024
+# Conservative characters per token estimate for truncating text to the context window
+CHARS_PER_TOKEN = 3
+# Seconds allowed per GB of weights for loading a model or generating metadata (minimum 60)
+TIMEOUT_PER_GB = 30
+# Seconds to wait for responses of the Ollama server (generously covers cold model loads)
+OLLAMA_TIMEOUT = 600
+# Errors of the Ollama client (server errors and connection failures)
+OLLAMA_ERRORS = (ollama.ResponseError, httpx.HTTPError)
+# Errors of a generation (API errors raised by litellm and failed validation after retries)
+GENERATION_ERRORS = (openai.APIError, InstructorRetryException)
 
+# Shared clients reuse their connection pool (host is taken from OLLAMA_HOST)
+client = ollama.Client(timeout=OLLAMA_TIMEOUT)
+aclient = ollama.AsyncClient(timeout=OLLAMA_TIMEOUT, transport=httpx.AsyncHTTPTransport(retries=2))
+console = Console()
 
-def compare(text):
-    # type: (str) -> None
+
+class RunResult(NamedTuple):
+    """Result of generating metadata for one text with one model (durations in nanoseconds)."""
+
+    model: str
+    params: str
+    quant: str
+    text_no: int
+    status: str
+    load_ns: int | None = None
+    execution_ns: int | None = None
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+
+
+async def compare(texts, refresh=False, verbose=False):
+    # type: (list[str], bool, bool) -> None
     """
     Compare metadata generation across different Ollama models.
 
-    :param text: Input text for metadata generation.
-    """
-    models = ollama.list()["models"]
-    sorted_models = sorted(
-        models,
-        key=lambda x: (
-            float(x["details"]["parameter_size"][:-1]),  # Remove last char and convert to float
-            x["details"]["quantization_level"],
-        ),
-    )
+    Models are evaluated concurrently, but at most `OLLAMA_MAX_LOADED_MODELS` (default 2) at the
+    same time so the server does not thrash swapping weights in and out of VRAM. Each model is
+    unloaded after it ran all texts back to back, so weights are loaded only once per model.
+    The largest models are started first to minimize the total run time, results are still
+    reported in order of model size.
+    Start the Ollama server with the same `OLLAMA_MAX_LOADED_MODELS` and
+    `OLLAMA_NUM_PARALLEL` set to at least that value.
 
-    results = []
+    Loading a model and each generation have to finish within a timeout proportional to the model
+    size, otherwise they are reported with status "Timeout".
+
+    Texts are truncated to the context window of each model (capped at `mg_opts.ollama_num_ctx`)
+    so small-context models do not silently drop the tail and latencies stay comparable.
 
+    Successful runs are cached per model and text. Models with cached results for all texts are
+    not run again and reported with status "Cached".
+
+    Besides the summary table, the raw results of runs measured in this invocation are appended
+    to `RESULTS_PATH` for longitudinal analysis across runs.
+
+    :param texts: Input texts for metadata generation.
+    :param refresh: Ignore cached results and measure all models again.
+    :param verbose: Print the generated metadata of each run.
+    """
+    models = [entry for entry in client.list()["models"] if is_chat_model(entry)]
+    # Sort by size in bytes, which predicts load time and memory fit across quantizations
+    sorted_models = sorted(models, key=lambda x: (x["size"], x["details"]["quantization_level"]))
+
+    semaphore = asyncio.Semaphore(int(os.getenv("OLLAMA_MAX_LOADED_MODELS", "2")))
+    budget = memory_budget()
+    tasks = []
     for entry in sorted_models:
         name = entry["name"]
-        if name in ignore:
-            log.debug(f"Skipping ignored model: {name}")
+        if budget is not None and entry["size"] * MEMORY_SLACK > budget:
+            log.warning(f"Skipping {name}: {entry['size'] / 1e9:.1f} GB exceeds available memory")
+            tasks.append(skip_model(entry, texts, "Skipped: exceeds memory"))
+            continue
+        cached = None if refresh else load_cached_results(entry, texts)
+        if cached is not None:
+            log.debug(f"Using cached results for {name}")
+            tasks.append(replay_results(cached))
             continue
+        tasks.append(run_model(entry, texts, semaphore, verbose))
 
-        full_name = f"ollama/{name}"
-        params = entry["details"]["parameter_size"]
-        quant = entry["details"]["quantization_level"]
-        log.debug(f"Testing {full_name} - {params} - {quant}")
-        try:
-            start_time = time.time()
-            result = generate_metadata(text, model=full_name)
-            end_time = time.time()
-            execution_time = round(end_time - start_time, 2)
-            print(result)
-            results.append((full_name, params, quant, execution_time, "Success"))
-        except Exception as e:
-            log.error(f"Failed {full_name} -> {e}")
-            results.append((full_name, params, quant, None, "Failed"))
+    # Start the largest models first (longest processing time first scheduling), so their slow
+    # loads overlap with the smaller models filling the remaining slots instead of running last
+    started = [asyncio.create_task(task) for task in reversed(tasks)][::-1]
+    results = [
+        result for model_results in await asyncio.gather(*started) for result in model_results
+    ]
 
     # Create and display the summary table
     table = Table(title="Model Comparison Results")
     table.add_column("Model", style="cyan")
     table.add_column("Parameters", style="magenta")
     table.add_column("Quantization", style="green")
+    table.add_column("Text", style="white")
+    table.add_column("Load Time (s)", style="blue")
     table.add_column("Execution Time (s)", style="blue")
+    table.add_column("Prompt Tokens", style="blue")
+    table.add_column("Gen Tokens", style="blue")
+    table.add_column("End-to-end tok/s", style="blue")
     table.add_column("Status", style="yellow")
 
-    for result in results:
-        model, params, quant, time_s, status = result
-        time_str = f"{time_s:.2f}" if time_s is not None else "N/A"
-        table.add_row(model, params, quant, time_str, status)
+    for r in results:
+        table.add_row(
+            r.model,
+            r.params,
+            r.quant,
+            str(r.text_no),
+            format_ns(r.load_ns),
+            format_ns(r.execution_ns),
+            format_int(r.prompt_tokens),
+            format_int(r.completion_tokens),
+            format_rate(r.completion_tokens, r.execution_ns),
+            r.status,
+        )
 
-    console = Console()
     console.print(table)
+    export_results(results, texts)
+
+
+def export_results(results, texts):
+    # type: (list[RunResult], list[str]) -> None
+    """
+    Append raw results of runs measured in this invocation as JSON Lines to `RESULTS_PATH`.
+
+    Cached and skipped results are left out, so earlier measurements are not counted twice or
+    credited to the current code revision. Each record is annotated with the text hash,
+    end-to-end throughput, timestamp, host and code revision so results of successive runs can be
+    aggregated and compared.
+
+    :param results: Results of all runs.
+    :param texts: Input texts the results refer to (by number).
+    """
+    text_hashes = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+    context = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "host": platform.node(),
+        "version": VERSION,
+        "git_sha": git_revision(),
+    }
+    measured = [r for r in results if r.status in MEASURED_STATUSES]
+    with open(RESULTS_PATH, "a", encoding="utf-8") as f:
+        for r in measured:
+            record = r._asdict()
+            record["text_hash"] = text_hashes[r.text_no - 1]
+            record["e2e_tok_s"] = (
+                r.completion_tokens / (r.execution_ns / 1e9)
+                if r.completion_tokens and r.execution_ns
+                else None
+            )
+            f.write(json.dumps(record | context) + "\n")
+    log.info(f"Appended {len(measured)} results to {RESULTS_PATH}")
+
+
+def git_revision():
+    # type: () -> str|None
+    """Return the git commit hash of the repository containing this script or None."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_ns(duration_ns):
+    # type: (int|None) -> str
+    """Format a duration in nanoseconds as seconds for display."""
+    return f"{duration_ns / 1e9:.2f}" if duration_ns is not None else "N/A"
+
+
+def format_int(value):
+    # type: (int|None) -> str
+    """Format an optional count for display."""
+    return str(value) if value is not None else "N/A"
+
+
+def format_rate(tokens, duration_ns):
+    # type: (int|None, int|None) -> str
+    """
+    Format end-to-end throughput in generated tokens per second of request time for display.
+
+    The request time includes prompt evaluation and all validation retries, so this is a lower
+    bound of the pure generation speed.
+    """
+    if not tokens or not duration_ns:
+        return "N/A"
+    return f"{tokens / (duration_ns / 1e9):.1f}"
+
+
+def is_chat_model(entry):
+    # type: (dict) -> bool
+    """Check whether a model entry is a chat model and not an embedding model."""
+    family = entry["details"].get("family")
+    return family not in EMBEDDING_FAMILIES and "embed" not in entry["name"]
+
+
+def memory_budget():
+    # type: () -> int|None
+    """
+    Estimate the memory available for model weights (free RAM plus free NVIDIA VRAM).
+
+    Ollama offloads layers that do not fit into VRAM to system memory, so a model only has to
+    fit into both combined.
+
+    :return: Available memory in bytes or None if it cannot be determined on this platform.
+    """
+    try:
+        ram = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+    try:
+        output = subprocess.run(
+            ["nvidia-smi", "--query-gpu=memory.free", "--format=csv,noheader,nounits"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        vram = sum(int(line) for line in output.split()) * 1024 * 1024
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        vram = 0
+    return ram + vram
+
+
+async def skip_model(entry, texts, status):
+    # type: (dict, list[str], str) -> list[RunResult]
+    """Report a model as skipped for all texts."""
+    full_name, params, quant = model_info(entry)
+    return [
+        RunResult(full_name, params, quant, text_no, status) for text_no in range(1, len(texts) + 1)
+    ]
+
+
+async def replay_results(results):
+    # type: (list[RunResult]) -> list[RunResult]
+    """Return previously computed results (awaitable alongside model runs)."""
+    return results
+
+
+def result_cache_key(entry, text):
+    # type: (dict, str) -> str
+    """Compute the cache key for the result of a model run on a text."""
+    return cache_key(
+        {"kind": "compare", "model": entry["digest"], "text": text, "version": VERSION}
+    )
+
+
+def load_cached_results(entry, texts):
+    # type: (dict, list[str]) -> list[RunResult]|None
+    """
+    Load cached results of a model for all texts.
+
+    :param entry: Model entry as returned by `ollama.list()`.
+    :param texts: Input texts for metadata generation.
+    :return: Cached results with status "Cached" or None if any text has no cached result.
+    """
+    results = []
+    for text_no, text in enumerate(texts, 1):
+        data = cache_get(result_cache_key(entry, text))
+        if data is None:
+            return None
+        result = RunResult(**json.loads(data))
+        results.append(result._replace(text_no=text_no, status="Cached"))
+    return results
+
+
+def store_cached_result(entry, text, result):
+    # type: (dict, str, RunResult) -> None
+    """Store the result of a successful model run on a text."""
+    try:
+        cache_put(result_cache_key(entry, text), json.dumps(result._asdict()).encode("utf-8"))
+    except OSError as e:
+        log.warning(f"Failed to cache result for {result.model} -> {e}")
+
+
+def model_info(entry):
+    # type: (dict) -> tuple[str, str, str]
+    """Returns the litellm model name, parameter size and quantization of a model entry."""
+    details = entry["details"]
+    return f"ollama/{entry['name']}", details["parameter_size"], details["quantization_level"]
+
+
+async def run_model(entry, texts, semaphore, verbose=False):
+    # type: (dict, list[str], asyncio.Semaphore, bool) -> list[RunResult]
+    """
+    Generate metadata for all texts with a single Ollama model while its weights stay loaded.
+
+    :param entry: Model entry as returned by `ollama.list()`.
+    :param texts: Input texts for metadata generation.
+    :param semaphore: Semaphore limiting the number of models loaded at the same time.
+    :param verbose: Print the generated metadata of each run.
+    :return: Results for each text.
+    """
+    async with semaphore:
+        try:
+            try:
+                load_ns = await warm_up_model(entry["name"], model_timeout(entry))
+            except TimeoutError:
+                log.error(f"Timeout loading {entry['name']}")
+                return await skip_model(entry, texts, "Timeout")
+            context = await context_length(entry["name"])
+            results = []
+            for text_no, text in enumerate(texts, 1):
+                prompt = truncate_text(text, context)
+                if len(prompt) < len(text):
+                    log.info(
+                        f"Truncated text {text_no} to {len(prompt) / len(text):.0%} "
+                        f"for {entry['name']} ({context} tokens context)"
+                    )
+                result = (await run_one(entry, prompt, text_no, verbose))._replace(load_ns=load_ns)
+                if result.status == "Success":
+                    store_cached_result(entry, text, result)
+                results.append(result)
+            return results
+        finally:
+            await unload_model(entry["name"])
+
+
+async def run_one(entry, text, text_no, verbose=False):
+    # type: (dict, str, int, bool) -> RunResult
+    """
+    Generate metadata with a single Ollama model and measure execution time and token usage.
+
+    :param entry: Model entry as returned by `ollama.list()`.
+    :param text: Input text for metadata generation.
+    :param text_no: Number of the input text.
+    :param verbose: Print the generated metadata.
+    :return: Result of the run (without load time).
+    """
+    full_name, params, quant = model_info(entry)
+    log.debug(f"Testing {full_name} - {params} - {quant} - text {text_no}")
+    try:
+        start_ns = time.perf_counter_ns()
+        result, completion = await asyncio.wait_for(
+            get_uncached_aclient().chat.completions.create_with_completion(
+                model=full_name,
+                max_retries=mg_opts.max_retries,
+                messages=metadata_messages(text),
+                response_model=BookMetadata,
+            ),
+            timeout=model_timeout(entry),
+        )
+        execution_ns = time.perf_counter_ns() - start_ns
+        if verbose:
+            console.print(result)
+        return RunResult(
+            full_name,
+            params,
+            quant,
+            text_no,
+            "Success",
+            execution_ns=execution_ns,
+            prompt_tokens=completion.usage.prompt_tokens,
+            completion_tokens=completion.usage.completion_tokens,
+        )
+    except TimeoutError:
+        log.error(f"Timeout {full_name} - text {text_no}")
+        return RunResult(full_name, params, quant, text_no, "Timeout")
+    except GENERATION_ERRORS as e:
+        log.error(f"Failed {full_name} -> {e}")
+        return RunResult(full_name, params, quant, text_no, "Failed")
+
+
+async def uncached_completion(**kwargs):
+    # type: (...) -> ModelResponse
+    """Call litellm `acompletion` with the package's Ollama options but without response cache."""
+    from litellm import acompletion
+
+    return await acompletion(**add_ollama_options(kwargs))
+
+
+@cache
+def get_uncached_aclient():
+    # type: () -> instructor.AsyncInstructor
+    """Create the async LLM client for measurements (cache hits would distort timings)."""
+    return instructor.from_litellm(uncached_completion, mode=mg_opts.instructor_mode)
+
+
+def model_timeout(entry):
+    # type: (dict) -> float
+    """Compute the timeout in seconds for loading a model or a single generation by its size."""
+    return max(60.0, entry["size"] / 1e9 * TIMEOUT_PER_GB)
+
+
+async def context_length(name):
+    # type: (str) -> int
+    """
+    Get the usable context length of a model in tokens.
+
+    The architecture specific context length reported by Ollama is capped at
+    `mg_opts.ollama_num_ctx`, which is the context size models are loaded with.
+
+    :param name: Ollama model name.
+    :return: Context length in tokens.
+    """
+    context = DEFAULT_CONTEXT
+    try:
+        info = await aclient.show(name)
+        # The key is prefixed with the model architecture (e.g. `llama.context_length`)
+        for key, value in info.get("model_info", {}).items():
+            if key.endswith(".context_length"):
+                context = int(value)
+                break
+    except (*OLLAMA_ERRORS, ValueError) as e:
+        log.warning(f"Failed to get context length of {name} -> {e}")
+    return min(context, mg_opts.ollama_num_ctx)
+
+
+def truncate_text(text, context):
+    # type: (str, int) -> str
+    """
+    Truncate text to fit into a context window, leaving room for instructions and response.
+
+    :param text: Input text for metadata generation.
+    :param context: Context length in tokens.
+    :return: Truncated text.
+    """
+    return text[: max(context - RESPONSE_TOKENS, 0) * CHARS_PER_TOKEN]
+
+
+async def warm_up_model(name, timeout):
+    # type: (str, float) -> int|None
+    """
+    Load a model with a minimal generation so the weight loading is not part of the measurement.
+
+    The runner options match the ones used for metadata generation, otherwise Ollama would
+    reload the model for the first measured request. The load time is the `load_duration`
+    reported by the server, which excludes request overhead and the generated warm-up token.
+
+    :param name: Ollama model name.
+    :param timeout: Timeout for loading the model in seconds.
+    :return: Load time in nanoseconds or None if the warm-up failed.
+    :raises TimeoutError: If the model did not load within the timeout.
+    """
+    options = {
+        "num_predict": 1,
+        "num_ctx": mg_opts.ollama_num_ctx,
+        "num_gpu": mg_opts.ollama_num_gpu,
+        "num_batch": mg_opts.ollama_num_batch,
+    }
+    try:
+        start_ns = time.perf_counter_ns()
+        response = await asyncio.wait_for(
+            aclient.generate(model=name, prompt="warmup", options=options), timeout=timeout
+        )
+        # Fall back to the client side duration if the server does not report the load time
+        return response.get("load_duration") or time.perf_counter_ns() - start_ns
+    except OLLAMA_ERRORS as e:
+        log.warning(f"Failed to warm up {name} -> {e}")
+        return None
+
+
+async def unload_model(name):
+    # type: (str) -> None
+    """Unload a model from the Ollama server to free VRAM for the next one."""
+    try:
+        await aclient.generate(model=name, keep_alive=0)
+    except OLLAMA_ERRORS as e:
+        log.warning(f"Failed to unload {name} -> {e}")
 
 
 if __name__ == "__main__":
     from iscc_metagen.pdf import pdf_extract_pages
 
     pdf = r"C:\Users\titusz\Productions\Bachem\2021_06\bergische-streifzuege_v01_bmks.pdf"
-    with fitz.open(pdf) as file:
-        text = pdf_extract_pages(file, first=10, last=5)
-    compare(text)
+    # Pass the path so the extraction is cached on disk by file content across runs
+    text = pdf_extract_pages(pdf, first=10, last=5)
+    asyncio.run(compare([text], verbose="--verbose" in sys.argv))
@@ -0,0 +1,22 @@
+from iscc_metagen.main import complete_metadata
+from iscc_metagen.schema import StreamedBookMetadata
+
+
+def test_complete_metadata_with_publisher_website():
+    # type: () -> None
+    """Completing a streamed result with a URL field must not fail when estimating the cost."""
+    partial = StreamedBookMetadata(
+        title="Bergische Streifzüge",
+        description="Ein Wanderführer durch das Bergische Land.",
+        keywords=["Wandern", "Bergisches Land", "Reiseführer"],
+        publisher="Bachem",
+        publisher_website="https://www.bachem.de/verlag",
+        year_published=2021,
+        language="de",
+        contributors=[],
+        isbns=[],
+    )
+    metadata = complete_metadata(partial, "gpt-4o-mini", "Bergische Streifzüge")
+    assert str(metadata.publisher_website) == "https://www.bachem.de/verlag"
+    assert metadata.model == "gpt-4o-mini"
+    assert metadata.response_cost is not None